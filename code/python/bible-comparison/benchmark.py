@@ -0,0 +1,216 @@
+"""Time each stage of the default comparison on the bundled editions.
+
+The stages are those of the default (dmp) run:
+- load_lines: parsing each edition's TSV, once per edition
+- get_verse_text: normalizing one verse
+- diff_linesToWords, diff_main, diff_charsToLines: the three steps of
+  diff_wordMode() for one verse pair whose texts differ
+- compare_verse_pair: one verse pair end to end, text plus diff
+- end_to_end: a whole run, load_lines through report() (printing to
+  /dev/null)
+Per-verse stages are timed once per verse (or pair) on each of --repeat
+passes. All samples of a stage are pooled into its p50/p95/p99 and total.
+The whole-run stages have one sample per pass. Results are saved as JSON.
+
+    python benchmark.py run [--output FILE] [--repeat N] [--editions A B]
+    python benchmark.py compare BASELINE [CURRENT] [--threshold 0.10]
+
+compare runs the benchmark when CURRENT isn't given. It prints each stage's
+figures next to the baseline's and exits with status 1 if any of them is
+more than --threshold slower.
+"""
+
+import argparse
+import contextlib
+import datetime
+import json
+import os
+import platform
+import sys
+import time
+
+import comparison_core
+import diff_match_patch as dmp_module
+
+
+BENCHMARK_VERSION = 1
+DEFAULT_OUTPUT = "benchmark.json"
+# fractional slowdown of a figure that counts as a regression
+DEFAULT_THRESHOLD = 0.10
+# slowdowns smaller than this many seconds are timer noise, whatever the ratio
+NOISE_SECONDS = 2e-6
+PERCENTILES = (50, 95, 99)
+METRICS = ["p50", "p95", "p99", "total"]
+
+
+def percentile(sorted_samples, percent):
+    # nearest-rank percentile of a sorted list
+    if not sorted_samples:
+        return 0.0
+    rank = max(1, -(-percent * len(sorted_samples) // 100))
+    return sorted_samples[rank - 1]
+
+
+def summarize(samples):
+    samples = sorted(samples)
+    summary = {"samples": len(samples), "total": sum(samples), "max": samples[-1] if samples else 0.0}
+    for percent in PERCENTILES:
+        summary[f"p{percent}"] = percentile(samples, percent)
+    return summary
+
+
+def time_load_lines(editions, samples):
+    verses = {}
+    for edition in editions:
+        start = time.perf_counter()
+        verses[edition] = comparison_core.load_lines(edition, f"{edition}-verses.tsv")
+        samples.append(time.perf_counter() - start)
+    return verses
+
+
+def time_verse_pairs(source_lines, compare_lines, samples):
+    # one pass of the per-verse stages over every verse pair
+    clock = time.perf_counter
+    dmp = dmp_module.diff_match_patch()
+    for identifier in sorted(set(source_lines).union(compare_lines)):
+        source_verse = source_lines.get(identifier)
+        compare_verse = compare_lines.get(identifier)
+        start = clock()
+        comparison_core.compare_verse_pair(source_verse, compare_verse)
+        samples["compare_verse_pair"].append(clock() - start)
+        if source_verse is None or compare_verse is None:
+            continue
+
+        start = clock()
+        text1 = comparison_core.get_verse_text(source_verse)
+        middle = clock()
+        text2 = comparison_core.get_verse_text(compare_verse)
+        end = clock()
+        samples["get_verse_text"].append(middle - start)
+        samples["get_verse_text"].append(end - middle)
+        if text1 == text2:
+            continue
+
+        start = clock()
+        chars1, chars2, line_array = dmp.diff_linesToWords(text1, text2)
+        samples["diff_linesToWords"].append(clock() - start)
+        start = clock()
+        diffs = dmp.diff_main(chars1, chars2, False)
+        samples["diff_main"].append(clock() - start)
+        start = clock()
+        dmp.diff_charsToLines(diffs, line_array)
+        samples["diff_charsToLines"].append(clock() - start)
+
+
+def time_end_to_end(editions, samples):
+    start = time.perf_counter()
+    with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull):
+        source_lines = comparison_core.load_lines(editions[0], f"{editions[0]}-verses.tsv")
+        compare_lines = comparison_core.load_lines(editions[1], f"{editions[1]}-verses.tsv")
+        comparison_core.report(comparison_core.iter_comparisons(source_lines, compare_lines), editions[0], editions[1])
+    samples.append(time.perf_counter() - start)
+
+
+def run_benchmark(editions, repeat):
+    samples = {stage: [] for stage in ["load_lines", "get_verse_text", "diff_linesToWords", "diff_main",
+                                       "diff_charsToLines", "compare_verse_pair", "end_to_end"]}
+    for _ in range(repeat):
+        with open(os.devnull, 'w', encoding='utf-8') as devnull, contextlib.redirect_stdout(devnull):
+            verses = time_load_lines(editions, samples["load_lines"])
+        time_verse_pairs(verses[editions[0]], verses[editions[1]], samples)
+        time_end_to_end(editions, samples["end_to_end"])
+    return {"benchmark_version": BENCHMARK_VERSION,
+            "created": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+            "python": platform.python_version(), "platform": platform.platform(),
+            "editions": editions, "repeat": repeat,
+            "stages": {stage: summarize(stage_samples) for stage, stage_samples in samples.items()}}
+
+
+def print_results(results):
+    print(f"{'stage':<20} {'samples':>8} {'p50 ms':>9} {'p95 ms':>9} {'p99 ms':>9} {'total s':>9}")
+    for stage, summary in results["stages"].items():
+        print(f"{stage:<20} {summary['samples']:>8} {summary['p50'] * 1000:>9.4f} {summary['p95'] * 1000:>9.4f} "
+              f"{summary['p99'] * 1000:>9.4f} {summary['total']:>9.3f}")
+
+
+def regressions(baseline, current, threshold=DEFAULT_THRESHOLD):
+    # (stage, metric, baseline seconds, current seconds) for each figure more than threshold slower than baseline.
+    # totals only compare when both runs took the same number of samples.
+    found = []
+    for stage, before in baseline["stages"].items():
+        after = current["stages"].get(stage)
+        if after is None:
+            continue
+        for metric in METRICS:
+            if metric == "total" and before["samples"] != after["samples"]:
+                continue
+            if after[metric] > before[metric] * (1 + threshold) and after[metric] - before[metric] > NOISE_SECONDS:
+                found.append((stage, metric, before[metric], after[metric]))
+    return found
+
+
+def print_comparison(baseline, current, found):
+    flagged = {(stage, metric) for stage, metric, before, after in found}
+    print(f"{'stage':<20} {'metric':<6} {'baseline ms':>12} {'current ms':>12} {'change':>8}")
+    for stage, before in baseline["stages"].items():
+        after = current["stages"].get(stage)
+        if after is None:
+            print(f"{stage:<20} missing from the current results")
+            continue
+        for metric in METRICS:
+            change = (after[metric] / before[metric] - 1) * 100 if before[metric] else 0.0
+            mark = "  REGRESSION" if (stage, metric) in flagged else ""
+            print(f"{stage:<20} {metric:<6} {before[metric] * 1000:>12.4f} {after[metric] * 1000:>12.4f} "
+                  f"{change:>+7.1f}%{mark}")
+    print(f"{len(found)} regressions")
+
+
+def load_results(path):
+    with open(path, 'r', encoding='utf-8') as infile:
+        return json.load(infile)
+
+
+def save_results(results, path):
+    with open(path, 'w', encoding='utf-8') as outfile:
+        json.dump(results, outfile, indent=1)
+        outfile.write("\n")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the stages of a comparison, or compare to a baseline.")
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run", help="run the benchmark and save the results")
+    run_parser.add_argument("--output", default=DEFAULT_OUTPUT, help="JSON file to save the results to")
+    compare_parser = commands.add_parser("compare", help="compare results to a baseline and flag regressions")
+    compare_parser.add_argument("baseline", help="JSON results of an earlier run")
+    compare_parser.add_argument("current", nargs="?", help="JSON results to check; runs the benchmark if omitted")
+    compare_parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD,
+                                help="flag figures more than this fraction slower than the baseline")
+    compare_parser.add_argument("--output", help="also save the results of the run to this JSON file")
+    for command_parser in (run_parser, compare_parser):
+        command_parser.add_argument("--repeat", type=int, default=3, help="passes over the editions")
+        command_parser.add_argument("--editions", nargs=2, default=["n1904", "sblgnt"], metavar="EDITION",
+                                    help="source and compare edition (data/tsv/EDITION-verses.tsv)")
+    args = parser.parse_args()
+
+    if args.command == "run":
+        results = run_benchmark(args.editions, args.repeat)
+        print_results(results)
+        save_results(results, args.output)
+        print(f"Saved {args.output}")
+        return
+
+    baseline = load_results(args.baseline)
+    if args.current:
+        current = load_results(args.current)
+    else:
+        current = run_benchmark(args.editions, args.repeat)
+        if args.output:
+            save_results(current, args.output)
+    found = regressions(baseline, current, args.threshold)
+    print_comparison(baseline, current, found)
+    sys.exit(1 if found else 0)
+
+
+if __name__ == "__main__":
+    main()
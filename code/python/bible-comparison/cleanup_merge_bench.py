@@ -0,0 +1,174 @@
+"""Check and time diff_cleanupMerge against the in-place version it replaced.
+
+The old implementation spliced the diff list in place and called itself again
+after every shift sweep that changed something. It is kept here as the
+reference. Random diffs (small alphabets, so every prefix/suffix/shift branch
+is hit) are run through both it and the current diff_match_patch and
+diff_sequence versions, and any mismatch is printed. Then both are timed on
+long fragmented diffs, one element per character or word, as a whole-chapter
+diff produces before merging.
+
+    python cleanup_merge_bench.py [random diffs to check]
+"""
+
+import random
+import sys
+import time
+
+import diff_match_patch as dmp_module
+import diff_sequence
+
+
+DIFF_DELETE = diff_sequence.DIFF_DELETE
+DIFF_INSERT = diff_sequence.DIFF_INSERT
+DIFF_EQUAL = diff_sequence.DIFF_EQUAL
+
+BENCH_SIZES = (10000, 50000, 200000)
+
+
+def legacy_cleanupMerge(diffs, empty):
+    # the previous diff_cleanupMerge, for str (empty='') or tuple (empty=()) diffs
+    diffs.append((DIFF_EQUAL, empty))
+    pointer = 0
+    count_delete = 0
+    count_insert = 0
+    text_delete = empty
+    text_insert = empty
+    while pointer < len(diffs):
+        if diffs[pointer][0] == DIFF_INSERT:
+            count_insert += 1
+            text_insert += diffs[pointer][1]
+            pointer += 1
+        elif diffs[pointer][0] == DIFF_DELETE:
+            count_delete += 1
+            text_delete += diffs[pointer][1]
+            pointer += 1
+        elif diffs[pointer][0] == DIFF_EQUAL:
+            if count_delete + count_insert > 1:
+                if count_delete != 0 and count_insert != 0:
+                    length = diff_sequence.common_prefix(text_insert, text_delete)
+                    if length != 0:
+                        x = pointer - count_delete - count_insert - 1
+                        if x >= 0 and diffs[x][0] == DIFF_EQUAL:
+                            diffs[x] = (diffs[x][0], diffs[x][1] + text_insert[:length])
+                        else:
+                            diffs.insert(0, (DIFF_EQUAL, text_insert[:length]))
+                            pointer += 1
+                        text_insert = text_insert[length:]
+                        text_delete = text_delete[length:]
+                    length = diff_sequence.common_suffix(text_insert, text_delete)
+                    if length != 0:
+                        diffs[pointer] = (diffs[pointer][0], text_insert[-length:] + diffs[pointer][1])
+                        text_insert = text_insert[:-length]
+                        text_delete = text_delete[:-length]
+                new_ops = []
+                if len(text_delete) != 0:
+                    new_ops.append((DIFF_DELETE, text_delete))
+                if len(text_insert) != 0:
+                    new_ops.append((DIFF_INSERT, text_insert))
+                pointer -= count_delete + count_insert
+                diffs[pointer:pointer + count_delete + count_insert] = new_ops
+                pointer += len(new_ops) + 1
+            elif pointer != 0 and diffs[pointer - 1][0] == DIFF_EQUAL:
+                diffs[pointer - 1] = (diffs[pointer - 1][0], diffs[pointer - 1][1] + diffs[pointer][1])
+                del diffs[pointer]
+            else:
+                pointer += 1
+            count_insert = 0
+            count_delete = 0
+            text_delete = empty
+            text_insert = empty
+
+    if diffs[-1][1] == empty:
+        diffs.pop()
+
+    changes = False
+    pointer = 1
+    while pointer < len(diffs) - 1:
+        if diffs[pointer - 1][0] == DIFF_EQUAL and diffs[pointer + 1][0] == DIFF_EQUAL:
+            previous = diffs[pointer - 1][1]
+            edit = diffs[pointer][1]
+            following = diffs[pointer + 1][1]
+            if diff_sequence.ends_with(edit, previous):
+                if previous:
+                    diffs[pointer] = (diffs[pointer][0], previous + edit[:-len(previous)])
+                    diffs[pointer + 1] = (diffs[pointer + 1][0], previous + following)
+                del diffs[pointer - 1]
+                changes = True
+            elif edit[:len(following)] == following:
+                diffs[pointer - 1] = (diffs[pointer - 1][0], previous + following)
+                diffs[pointer] = (diffs[pointer][0], edit[len(following):] + following)
+                del diffs[pointer + 1]
+                changes = True
+        pointer += 1
+
+    if changes:
+        legacy_cleanupMerge(diffs, empty)
+
+
+def random_diffs(rng, count, alphabet, piece_length, as_tuple):
+    diffs = []
+    for _ in range(count):
+        piece = [rng.choice(alphabet) for _ in range(rng.randint(0, piece_length))]
+        diffs.append((rng.choice((DIFF_DELETE, DIFF_EQUAL, DIFF_INSERT)), tuple(piece) if as_tuple else "".join(piece)))
+    return diffs
+
+
+def fragmented_diffs(rng, count, as_tuple):
+    # one single-character (or single-word) element per step, mostly equalities
+    ops = (DIFF_EQUAL, DIFF_EQUAL, DIFF_EQUAL, DIFF_EQUAL, DIFF_DELETE, DIFF_INSERT)
+    return [(rng.choice(ops), (rng.randrange(8),) if as_tuple else rng.choice("abcdefgh")) for _ in range(count)]
+
+
+def check(rounds, seed=1):
+    # number of random diffs where the current implementations disagree with the legacy one
+    rng = random.Random(seed)
+    dmp = dmp_module.diff_match_patch()
+    differ = diff_sequence.SequenceDiff()
+    mismatches = 0
+    for _ in range(rounds):
+        alphabet = rng.choice(("a", "ab", "abc"))
+        for as_tuple, cleanup in ((False, dmp.diff_cleanupMerge), (True, differ.diff_cleanupMerge)):
+            diffs = random_diffs(rng, rng.randint(0, 9), alphabet, 3, as_tuple)
+            expected = list(diffs)
+            legacy_cleanupMerge(expected, () if as_tuple else "")
+            actual = list(diffs)
+            cleanup(actual)
+            if actual != expected:
+                mismatches += 1
+                print(f"mismatch: {diffs}\n  legacy:  {expected}\n  current: {actual}")
+    return mismatches
+
+
+def timed(cleanup, diffs):
+    diffs = list(diffs)
+    start = time.perf_counter()
+    cleanup(diffs)
+    return time.perf_counter() - start, diffs
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 20000
+    mismatches = check(rounds)
+    print(f"{rounds} random diffs per engine, {mismatches} mismatches")
+
+    rng = random.Random(2)
+    dmp = dmp_module.diff_match_patch()
+    differ = diff_sequence.SequenceDiff()
+    print(f"{'engine':<16} {'elements':>9} {'legacy':>9} {'current':>9} {'speedup':>8}")
+    for size in BENCH_SIZES:
+        for name, as_tuple, cleanup in (("diff_match_patch", False, dmp.diff_cleanupMerge),
+                                        ("diff_sequence", True, differ.diff_cleanupMerge)):
+            diffs = fragmented_diffs(rng, size, as_tuple)
+            legacy_time, expected = timed(lambda diffs: legacy_cleanupMerge(diffs, () if as_tuple else ""), diffs)
+            current_time, actual = timed(cleanup, diffs)
+            if actual != expected:
+                mismatches += 1
+                print(f"mismatch on a {size} element {name} diff")
+            print(f"{name:<16} {size:>9} {legacy_time:>8.3f}s {current_time:>8.3f}s "
+                  f"{legacy_time / current_time:>7.1f}x")
+    sys.exit(1 if mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,139 +1,276 @@
-import re
-import dataclasses
-from biblelib.word import BCVID
-from greek_normalisation.utils import nfkc, strip_accents
-import diff_match_patch as dmp_module
-
-
-@dataclasses.dataclass
-class Word:
-    identifier: str
-    text: str
-
-@dataclasses.dataclass
-class Verse:
-    identifier: str
-    book: str
-    chapter: str
-    verse: str
-    usfm: str
-    # the str is the Word.identifier so we can sort to ensure word order
-    words: dict[str, Word] = dataclasses.field(default_factory=list)
-
-
-def load_lines(edition, edition_file_name):
-    print(f"Loading {edition}")
-    return_lines = {}
-    previous_verse_id = "40001001"
-    current_verse_id = ""
-    words = {}
-    with open(f'{git_dir}data/tsv/{edition_file_name}', 'r', encoding='utf-8') as infile:
-        lines = infile.readlines()
-        for line in lines:
-            if line.startswith('Verse'):
-                continue
-            line = line.rstrip('\n')
-            # split the line on tabs and stitch things together
-            cols = line.split('\t')
-            bcv = BCVID(cols[0])
-            # create the verse object if it doesn't exist
-            current_verse_id = bcv.book_ID + bcv.chapter_ID + bcv.verse_ID
-            if previous_verse_id != current_verse_id:
-                # we need to dump verse info.
-                previous_bcv = BCVID(previous_verse_id)
-                return_lines[previous_verse_id] = Verse(previous_verse_id, previous_bcv.book_ID, previous_bcv.chapter_ID,
-                                                        previous_bcv.verse_ID, previous_bcv.to_usfm(), words)
-                previous_verse_id = current_verse_id
-                words = {}
-
-            # create the word object
-            # split on space
-            verse_words = cols[1].split(' ')
-            word_in_verse = 1
-            for current_word in verse_words:
-                # zeropad word_in_verse with leading zeros
-                word_id = current_verse_id + str(word_in_verse).zfill(3)
-                # remove non-word chars from word.text. option to ignore case, remove accents, etc.?
-                word = Word(word_id, current_word)
-                word.text = re.sub(r'\W+', '', word.text)
-                words[word.identifier] = word
-                word_in_verse += 1
-
-        bcv = BCVID(current_verse_id)
-        return_lines[current_verse_id] = Verse(current_verse_id, bcv.book_ID, bcv.chapter_ID, bcv.verse_ID, bcv.to_usfm(), words)
-
-    return return_lines
-
-
-def get_verse_text(verse):
-    return_text = ""
-    # case-insensitive? strip accents?
-    for word in verse.words:
-        return_text += strip_accents(verse.words[word].text) + " "
-    return nfkc(return_text.rstrip().lower())
-
-# added RWB 2023-10-21 for word-level diffs
-def diff_wordMode(text1, text2):
-    dmp = dmp_module.diff_match_patch()
-    initial_diff = dmp.diff_linesToWords(text1, text2)
-    wordText1 = initial_diff[0]
-    wordText2 = initial_diff[1]
-    lineArray = initial_diff[2]
-    diffs = dmp.diff_main(wordText1, wordText2, False)
-    dmp.diff_charsToLines(diffs, lineArray)
-    # diff_cleanupSemantic() causes issues when comparing word-level
-    # dmp.diff_cleanupSemantic(diffs)
-    return diffs
-
-
-# some globals
-git_dir = "C:/git/RickBrannan/bible-comparison/"
-
-# need to load editions in a lines format
-# both source_gnt_lines and compare_gnt_lines are dict[Verse.identifier, Verse] so verses can be sorted properly
-source_edition = "n1904"
-compare_edition = "sblgnt"
-source_gnt_lines = load_lines(source_edition, f"{source_edition}-verses.tsv")
-compare_gnt_lines = load_lines(compare_edition, f"{compare_edition}-verses.tsv")
-
-# get keys from source_gnt_lines and sort
-# because I don't know if dicts in python preserve order
-source_gnt_keys = list(source_gnt_lines.keys())
-source_gnt_keys.sort()
-
-# some counters
-verse_match_count = 0
-verse_difference_count = 0
-
-for source_gnt_verse in source_gnt_keys:
-    bcv = BCVID(source_gnt_verse)
-    print(f"Current: {bcv.to_usfm()} ({source_gnt_verse})")
-    # we have the same verse in SBLGNT?
-    if compare_gnt_lines.__contains__(source_gnt_verse):
-        source_gnt_verse_text = get_verse_text(source_gnt_lines[source_gnt_verse])
-        compare_gnt_verse_text = get_verse_text(compare_gnt_lines[source_gnt_verse])
-
-        # if the verses are exact, we skip everything and log it
-        if source_gnt_verse_text == compare_gnt_verse_text:
-            print("Exact match for " + source_gnt_verse)
-            verse_match_count += 1
-            continue
-
-        # do the diff
-        #  0 == text that matches between editions
-        # -1 == text that is in source_edition but not compare_edition
-        #  1 == text that is in compare_edition but not source_edition
-        diff = diff_wordMode(source_gnt_verse_text, compare_gnt_verse_text)
-        verse_difference_count += 1
-        print(diff)
+import argparse
+import functools
+import comparison_core
+
+
+def report_diff_settings(cache, stats):
+    # after the report: close the diff cache and print its counts, and how many diffs ran out of budget
+    if cache is not None:
+        cache.close()
+        print(cache.summary())
+    if stats is not None:
+        print(f"Diff budget exhausted: {stats.budget_exhausted} of {stats.diffs} diffs")
+
+
+def main():
+    # the feature modules are imported here and in run_comparison(), where they're used, so importing
+    # compare_verses (or comparison_core) doesn't load SQLite, process pools or the profiler
+    import comparison_writer
+    import diff_cache
+    import instrumentation
+
+    parser = argparse.ArgumentParser(description="Word-level comparison of two Greek NT editions.")
+    parser.add_argument("--merge-join", action="store_true",
+                        help="walk both (BCV-ordered) editions in one pass instead of loading them into memory")
+    parser.add_argument("--cache-dir",
+                        help="cache parsed and normalized editions in this directory and reuse them on later runs")
+    parser.add_argument("--store-dir",
+                        help="read editions from memory-mapped columnar stores in this directory, building them if needed")
+    parser.add_argument("--compact", action="store_true",
+                        help="hold verses as CompactVerse (integer ids plus token id tuples) instead of Verse/Word")
+    parser.add_argument("--workers", type=int, default=1,
+                        help="diff on a pool of this many processes, one task per book")
+    parser.add_argument("--shared-memory", action="store_true",
+                        help="with --workers, publish the encoded editions once in shared memory for the workers")
+    parser.add_argument("--intern", action="store_true",
+                        help="encode every verse once at load time against one word vocabulary shared by all diffs")
+    parser.add_argument("--engine", choices=["dmp", "sequence"], default="dmp",
+                        help="diff engine: diff_match_patch on chr()-encoded words, or diff_sequence on word ids, "
+                             "which gives the same diffs (implies --intern)")
+    parser.add_argument("--diff-cache",
+                        help="keep verse diffs in this SQLite file and reuse them for verse pairs whose text is unchanged")
+    parser.add_argument("--diff-cache-mb", type=float, default=diff_cache.DEFAULT_MAX_BYTES / 2**20,
+                        help="evict least recently used diffs once the diff cache is larger than this")
+    parser.add_argument("--diff-budget", type=int, default=0, metavar="DIAGONALS",
+                        help="limit each diff to this much Myers bisection work instead of a 1 second timeout, so "
+                             "output is the same however loaded the machine is, and count diffs that run out")
+    parser.add_argument("--span", choices=["verse", "chapter", "book"], default="verse",
+                        help="diff a whole chapter or book at once, with a sentinel token between verses, and split "
+                             "the result back into verses (implies --intern and walks the editions like --merge-join)")
+    parser.add_argument("--no-transpositions", action="store_true",
+                        help="don't pair deleted and inserted runs of the same words and report them as transposed")
+    parser.add_argument("--output", metavar="FILE",
+                        help="write one JSONL or TSV record per verse pair to this file instead of printing the report")
+    parser.add_argument("--output-format", choices=comparison_writer.FORMATS,
+                        help="format of --output (default: tsv for a .tsv file, otherwise jsonl)")
+    parser.add_argument("--skip-matches", action="store_true",
+                        help="leave exact matches out of --output")
+    parser.add_argument("--results-db", metavar="FILE",
+                        help="load editions, verse statuses, diff ops and edited words into this SQLite file "
+                             "instead of printing the report")
+    parser.add_argument("--instrument", action="store_true",
+                        help=f"print the time and calls of each stage, the slowest verse pairs and the diff_bisect "
+                             f"calls and halfMatch splits after the run (or set {instrumentation.ENV_VAR}=1)")
+    parser.add_argument("--slowest", type=int, default=instrumentation.DEFAULT_SLOWEST, metavar="N",
+                        help="with --instrument, how many of the slowest verse pairs to list")
+    parser.add_argument("--profile", metavar="START-END",
+                        help="run cProfile over the verse pairs in this range of verse id prefixes, e.g. 40005-40007 "
+                             "for Matthew 5-7, and save the stats (implies --instrument)")
+    parser.add_argument("--profile-output", default=instrumentation.DEFAULT_PROFILE_OUTPUT, metavar="FILE",
+                        help="pstats file for --profile")
+    parser.add_argument("--editions", nargs="+", default=["n1904", "sblgnt"], metavar="EDITION",
+                        help="editions to compare (data/tsv/EDITION-verses.tsv); the first is the base")
+    parser.add_argument("--pairs", choices=["base", "matrix"], default="base",
+                        help="with more than two editions, compare the base against each other edition, "
+                             "or every pair of editions")
+    args = parser.parse_args()
+    if sum(map(bool, (args.cache_dir, args.store_dir, args.compact))) > 1:
+        parser.error("only one of --cache-dir, --store-dir and --compact can be used")
+    if args.shared_memory and args.workers < 2:
+        parser.error("--shared-memory needs --workers")
+    if args.workers > 1 and (args.compact or (args.cache_dir and not args.shared_memory)):
+        parser.error("--workers reads the TSV files or --store-dir stores directly and can't be combined with "
+                     "--compact or (without --shared-memory) --cache-dir")
+    if args.shared_memory and args.store_dir:
+        parser.error("--shared-memory can't be combined with --store-dir")
+    if args.diff_cache and args.workers > 1:
+        parser.error("--diff-cache can't be combined with --workers")
+    if args.diff_budget and args.workers > 1:
+        parser.error("--diff-budget can't be combined with --workers")
+    if args.span != "verse" and (args.workers > 1 or args.diff_cache or len(args.editions) > 2):
+        parser.error("--span can't be combined with --workers, --diff-cache or more than two --editions")
+    if len(args.editions) < 2:
+        parser.error("--editions needs at least two editions")
+    if len(args.editions) > 2 and (args.store_dir or args.compact or (args.workers > 1 and not args.shared_memory)):
+        parser.error("more than two --editions can't be combined with --store-dir, --compact "
+                     "or (without --shared-memory) --workers")
+    if (args.output_format or args.skip_matches) and not args.output:
+        parser.error("--output-format and --skip-matches need --output")
+    if args.output and args.results_db:
+        parser.error("only one of --output and --results-db can be used")
+    instrument = args.instrument or args.profile or instrumentation.enabled_by_environment()
+    if instrument and args.workers > 1:
+        parser.error(f"--instrument, --profile and {instrumentation.ENV_VAR} time the diffs in this process "
+                     f"and can't be combined with --workers")
+    if args.profile:
+        if args.span != "verse":
+            parser.error("--profile times verse pairs in this process and can't be combined with --span")
+        try:
+            comparison_core.parse_verse_range(args.profile)
+        except ValueError as error:
+            parser.error(str(error))
+
+    instruments = None
+    if instrument:
+        instruments = instrumentation.Instrumentation(args.slowest, args.profile, args.profile_output)
+        instruments.install()
+
+    writer = None
+    if args.results_db:
+        import results_store
+        writer = results_store.ResultsStore(args.results_db)
+    elif args.output:
+        output_format = args.output_format or ("tsv" if args.output.endswith(".tsv") else "jsonl")
+        writer = comparison_writer.ComparisonWriter(args.output, output_format, args.skip_matches)
+    try:
+        run_comparison(args, writer, None if instruments is None else instruments.stats)
+    except BaseException:
+        # a failed --results-db load is dropped and leaves the previous database in place
+        if args.results_db:
+            writer.abort()
+        raise
+    finally:
+        if writer is not None:
+            writer.close()
+        if instruments is not None:
+            instruments.uninstall()
+    if instruments is not None:
+        instruments.report()
+
+
+def run_comparison(args, writer=None, stats=None):
+    # stats, if given, is the DiffStats to record every diff in (see instrumentation)
+    # need to load editions in a lines format
+    editions = args.editions
+    source_edition = editions[0]
+    compare_edition = editions[1]
+    import multi_compare
+    edition_pairs = multi_compare.edition_pairs(editions, args.pairs == "matrix")
+    if args.shared_memory:
+        import edition_cache
+        import shared_corpus
+        if args.cache_dir:
+            encoded_editions = [edition_cache.load_edition(edition, f"{edition}-verses.tsv", args.cache_dir)
+                                for edition in editions]
+        else:
+            encoded_editions = [edition_cache.encode_edition(edition, f"{edition}-verses.tsv")
+                                for edition in editions]
+        edition_indexes = [(editions.index(source), editions.index(compare)) for source, compare in edition_pairs]
+        for source_index, compare_index, comparisons in shared_corpus.iter_shared_pair_comparisons(
+                encoded_editions, args.workers, edition_indexes, args.merge_join, args.engine):
+            if len(edition_pairs) > 1:
+                print(f"Comparing {editions[source_index]} with {editions[compare_index]}")
+            comparison_core.report(comparisons, editions[source_index], editions[compare_index],
+                                   not args.no_transpositions, writer)
+        return
+
+    cache = None
+    if args.diff_cache:
+        import diff_cache
+        cache = diff_cache.DiffCache(args.diff_cache, diff_cache.engine_settings(args.engine, budget=args.diff_budget),
+                                     int(args.diff_cache_mb * 2**20))
+    if stats is None and args.diff_budget:
+        stats = comparison_core.DiffStats()
+
+    if len(editions) > 2:
+        # every edition is loaded and interned once, into one vocabulary, then each pair is compared
+        word_vocabulary = comparison_core.Vocabulary()
+        encode, diff_encoded = comparison_core.engine_encoding(args.engine)
+        diff = functools.partial(diff_encoded, vocabulary=word_vocabulary, budget=args.diff_budget, stats=stats)
+        if cache is not None:
+            diff = cache.cached(diff, functools.partial(comparison_core.interned_text, vocabulary=word_vocabulary))
+        interned_editions = multi_compare.load_interned_editions(editions, word_vocabulary, encode, args.cache_dir)
+        for source, compare, comparisons in multi_compare.iter_pair_comparisons(interned_editions, edition_pairs,
+                                                                                 diff, args.merge_join):
+            print(f"Comparing {source} with {compare}")
+            comparison_core.report(comparisons, source, compare, not args.no_transpositions, writer)
+        report_diff_settings(cache, stats if args.diff_budget else None)
+        return
+
+    if args.workers > 1:
+        import parallel_compare
+        comparisons = parallel_compare.iter_parallel_comparisons(source_edition, f"{source_edition}-verses.tsv",
+                                                                 compare_edition, f"{compare_edition}-verses.tsv",
+                                                                 args.workers, args.merge_join, args.engine,
+                                                                 args.intern, args.store_dir)
+        comparison_core.report(comparisons, source_edition, compare_edition, not args.no_transpositions, writer)
+        return
+
+    # edition stores opened for --store-dir, whose mappings are closed once the report is done
+    stores = []
+    if args.cache_dir:
+        import edition_cache
+        source_verses = edition_cache.load_edition(source_edition, f"{source_edition}-verses.tsv",
+                                                   args.cache_dir).verses()
+        compare_verses = edition_cache.load_edition(compare_edition, f"{compare_edition}-verses.tsv",
+                                                    args.cache_dir).verses()
+        # cached verses carry their digest and only build their text if it is asked for
+        verse_text = edition_cache.cached_verse_text
+        verse_digest = comparison_core.stored_verse_digest
+    elif args.store_dir:
+        import edition_store
+        # VerseViews build their words lazily from the mapped file, so get_verse_text() works on them as-is
+        stores = [edition_store.open_store(edition, f"{edition}-verses.tsv", args.store_dir)
+                  for edition in (source_edition, compare_edition)]
+        source_verses = iter(stores[0])
+        compare_verses = iter(stores[1])
+        verse_text = comparison_core.get_verse_text
+        verse_digest = comparison_core.stored_verse_digest
+    elif args.compact:
+        vocabulary = comparison_core.Vocabulary()
+        source_verses = comparison_core.iter_compact_verses(source_edition, f"{source_edition}-verses.tsv", vocabulary)
+        compare_verses = comparison_core.iter_compact_verses(compare_edition, f"{compare_edition}-verses.tsv",
+                                                             vocabulary)
+        verse_text = comparison_core.compact_verse_text
+        verse_digest = None
+    else:
+        source_verses = comparison_core.iter_verses(source_edition, f"{source_edition}-verses.tsv")
+        compare_verses = comparison_core.iter_verses(compare_edition, f"{compare_edition}-verses.tsv")
+        verse_text = comparison_core.get_verse_text
+        verse_digest = None
+
+    diff = comparison_core.diff_wordMode
+    if stats is not None:
+        diff = functools.partial(comparison_core.diff_wordMode, budget=args.diff_budget, stats=stats)
+    if args.intern or args.engine != "dmp" or args.span != "verse":
+        word_vocabulary = comparison_core.Vocabulary()
+        encode, diff_encoded = comparison_core.engine_encoding(args.engine)
+        source_verses = comparison_core.intern_verses(source_verses, word_vocabulary, verse_text, encode)
+        compare_verses = comparison_core.intern_verses(compare_verses, word_vocabulary, verse_text, encode)
+        verse_text = comparison_core.interned_verse_text
+        # interned verses compare their encoded tokens instead
+        verse_digest = None
+        diff = functools.partial(diff_encoded, vocabulary=word_vocabulary, budget=args.diff_budget, stats=stats)
+
+    if cache is not None:
+        if verse_text is comparison_core.interned_verse_text:
+            diff = cache.cached(diff, functools.partial(comparison_core.interned_text, vocabulary=word_vocabulary))
+        else:
+            diff = cache.cached(diff)
+
+    if args.span != "verse":
+        # one diff per chapter or book, split back into verses
+        import span_compare
+        diff = functools.partial(span_compare.diff_span, engine=args.engine, budget=args.diff_budget, stats=stats)
+        comparisons = span_compare.iter_span_comparisons(source_verses, compare_verses, args.span, diff,
+                                                         word_vocabulary, not args.no_transpositions)
+    elif args.merge_join:
+        # missing verses on either side are reported inline, in BCV order
+        comparisons = comparison_core.iter_merge_comparisons(source_verses, compare_verses, verse_text, diff,
+                                                             verse_digest)
     else:
-        print(f"{source_edition} {bcv.to_usfm()} ({source_gnt_verse}) not in {compare_edition}")
+        # both are dict[Verse.identifier, Verse], same as load_lines()
+        source_gnt_lines = {verse.identifier: verse for verse in source_verses}
+        compare_gnt_lines = {verse.identifier: verse for verse in compare_verses}
+        comparisons = comparison_core.iter_comparisons(source_gnt_lines, compare_gnt_lines, verse_text, diff,
+                                                       verse_digest)
+    try:
+        comparison_core.report(comparisons, source_edition, compare_edition, not args.no_transpositions, writer)
+    finally:
+        for store in stores:
+            store.close()
+    report_diff_settings(cache, stats if args.diff_budget else None)
 
-# we also need to find the compare_edition verses that are not in source_edition (e.g. 3Jn 1:15)
-for compare_verse in compare_gnt_lines:
-    if not source_gnt_lines.__contains__(compare_verse):
-        bcv = BCVID(compare_verse)
-        print(f"{compare_edition} {bcv.to_usfm()} ({compare_edition}) not in {source_edition}")
 
-print(f"Verse match count: {verse_match_count}")
-print(f"Verse difference count: {verse_difference_count}")
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,494 @@
+"""Verses, editions and word-level comparison of verse pairs.
+
+This is the library under compare_verses.py and the other tools: the Word,
+Verse and CompactVerse records and the Vocabulary they are interned into,
+the streaming edition loaders, verse text normalization, the word-mode diffs
+of each --engine, VerseComparison with compare_verse_pair() and the loops
+over a pair of editions, and the printed report. It only needs the diff
+engines and word_order, so importing it doesn't pull in the CLI's optional
+features (SQLite, process pools, profiling).
+"""
+
+import dataclasses
+import hashlib
+import os
+import re
+
+from biblelib.word import BCVID
+from greek_normalisation.utils import nfkc, strip_accents
+
+import diff_match_patch as dmp_module
+import diff_sequence
+import word_order
+
+
+# non-word characters removed from each word when an edition is loaded
+WORD_PATTERN = r'\W+'
+
+
+@dataclasses.dataclass(slots=True)
+class Word:
+    identifier: str
+    text: str
+
+@dataclasses.dataclass(slots=True)
+class Verse:
+    identifier: str
+    book: str
+    chapter: str
+    verse: str
+    usfm: str
+    # the str is the Word.identifier so we can sort to ensure word order
+    words: dict[str, Word] = dataclasses.field(default_factory=list)
+
+
+class Vocabulary:
+    # interns word texts to small integer ids. id 0 is reserved for the empty string, the same way
+    # diff_match_patch's lineArray keeps a junk entry at 0.
+    __slots__ = ("words", "ids", "normalized_words")
+
+    def __init__(self):
+        self.words = ['']
+        self.ids = {'': 0}
+        # normalize_word() of each id, filled in on first use
+        self.normalized_words = []
+
+    def __len__(self):
+        return len(self.words)
+
+    def intern(self, text):
+        word_id = self.ids.get(text)
+        if word_id is None:
+            word_id = self.ids[text] = len(self.words)
+            self.words.append(text)
+        return word_id
+
+    def encode(self, text):
+        # the ids of text split the way diff_linesToWords() splits it: on spaces, each space kept with the
+        # word before it. unlike the chr() encoding there is no limit on the size of the vocabulary.
+        words = text.split(' ')
+        ids = [self.intern(word + ' ') for word in words[:-1]]
+        if words[-1]:
+            ids.append(self.intern(words[-1]))
+        return tuple(ids)
+
+    def normalized(self, word_id):
+        normalized_words = self.normalized_words
+        while len(normalized_words) <= word_id:
+            normalized_words.append(normalize_word(self.words[len(normalized_words)]))
+        return normalized_words[word_id]
+
+
+class CompactVerse:
+    # a Verse held as an integer id plus a tuple of Vocabulary ids, in word order.
+    # book/chapter/verse/usfm/words are derived on access so the Verse interface still works.
+    __slots__ = ("verse_id", "token_ids", "vocabulary")
+
+    def __init__(self, verse_id, token_ids, vocabulary):
+        self.verse_id = verse_id
+        self.token_ids = token_ids
+        self.vocabulary = vocabulary
+
+    @property
+    def identifier(self):
+        return f"{self.verse_id:08d}"
+
+    @property
+    def book(self):
+        return self.identifier[:2]
+
+    @property
+    def chapter(self):
+        return self.identifier[2:5]
+
+    @property
+    def verse(self):
+        return self.identifier[5:]
+
+    @property
+    def usfm(self):
+        return BCVID(self.identifier).to_usfm()
+
+    @property
+    def words(self):
+        identifier = self.identifier
+        words = {}
+        for word_in_verse, word_id in enumerate(self.token_ids, start=1):
+            word_identifier = identifier + str(word_in_verse).zfill(3)
+            words[word_identifier] = Word(word_identifier, self.vocabulary.words[word_id])
+        return words
+
+
+def edition_path(edition_file_name):
+    # a file name with a directory in it (e.g. from ComparisonSession's data_dir) is used as it is.
+    # edition names are matched case-insensitively, so n1904 finds N1904-verses.tsv on a case-sensitive
+    # filesystem too
+    path = edition_file_name if os.path.dirname(edition_file_name) else f'{git_dir}data/tsv/{edition_file_name}'
+    if os.path.exists(path):
+        return path
+    directory, file_name = os.path.split(path)
+    if os.path.isdir(directory):
+        for name in os.listdir(directory):
+            if name.lower() == file_name.lower():
+                return os.path.join(directory, name)
+    return path
+
+
+def build_verse(verse_id, words):
+    bcv = BCVID(verse_id)
+    return Verse(verse_id, bcv.book_ID, bcv.chapter_ID, bcv.verse_ID, bcv.to_usfm(), words)
+
+
+def parse_verses(lines):
+    # group edition TSV lines into Verse objects. a verse is yielded as soon as the next verse id
+    # shows up (or the lines run out), so only the verse being read is ever held in memory.
+    current_verse_id = None
+    words = {}
+    for line in lines:
+        if line.startswith('Verse'):
+            continue
+        line = line.rstrip('\n')
+        # split the line on tabs and stitch things together
+        cols = line.split('\t')
+        bcv = BCVID(cols[0])
+        verse_id = bcv.book_ID + bcv.chapter_ID + bcv.verse_ID
+        if verse_id != current_verse_id:
+            # the previous verse is complete, hand it off
+            if current_verse_id is not None:
+                yield build_verse(current_verse_id, words)
+            current_verse_id = verse_id
+            words = {}
+
+        # create the word object
+        # split on space
+        verse_words = cols[1].split(' ')
+        word_in_verse = 1
+        for current_word in verse_words:
+            # zeropad word_in_verse with leading zeros
+            word_id = verse_id + str(word_in_verse).zfill(3)
+            # remove non-word chars from word.text. option to ignore case, remove accents, etc.?
+            word = Word(word_id, current_word)
+            word.text = re.sub(WORD_PATTERN, '', word.text)
+            words[word.identifier] = word
+            word_in_verse += 1
+
+    if current_verse_id is not None:
+        yield build_verse(current_verse_id, words)
+
+
+def iter_verses(edition, edition_file_name):
+    # stream the edition one verse at a time
+    print(f"Loading {edition}")
+    with open(edition_path(edition_file_name), 'r', encoding='utf-8') as infile:
+        yield from parse_verses(infile)
+
+
+def load_lines(edition, edition_file_name, token_index=None):
+    # dict[Verse.identifier, Verse], built on top of the streaming loader. pass a token_index.TokenIndexBuilder
+    # to index the edition's words in the same pass.
+    verses = {}
+    for verse in iter_verses(edition, edition_file_name):
+        verses[verse.identifier] = verse
+        if token_index is not None:
+            token_index.add_verse(verse)
+    return verses
+
+
+def iter_compact_verses(edition, edition_file_name, vocabulary):
+    # same stream as iter_verses(), but each verse is turned into a CompactVerse as soon as it is read
+    for verse in iter_verses(edition, edition_file_name):
+        yield CompactVerse(int(verse.identifier), tuple([vocabulary.intern(word.text) for word in verse.words.values()]),
+                           vocabulary)
+
+
+def load_compact_lines(edition, edition_file_name, vocabulary=None):
+    # dict[CompactVerse.verse_id, CompactVerse]. pass the same vocabulary to several editions to share word ids.
+    if vocabulary is None:
+        vocabulary = Vocabulary()
+    return {verse.verse_id: verse for verse in iter_compact_verses(edition, edition_file_name, vocabulary)}
+
+
+def normalize_word(text):
+    # the per-word part of get_verse_text(), for callers that normalize each distinct word once
+    return nfkc(strip_accents(text).lower())
+
+
+def get_verse_text(verse):
+    # case-insensitive? strip accents?
+    return_text = " ".join([strip_accents(word.text) for word in verse.words.values()])
+    return nfkc(return_text.rstrip().lower())
+
+
+def text_digest(text):
+    # 64-bit digest of a normalized verse text. editions store one per verse, so equal verses can be
+    # found by comparing two ints instead of building and comparing both texts
+    return int.from_bytes(hashlib.blake2b(text.encode('utf-8'), digest_size=8).digest(), 'little')
+
+
+def stored_verse_digest(verse):
+    # for verses that carry a precomputed digest (edition_cache.CachedVerse, edition_store.VerseView)
+    return verse.digest
+
+
+def compact_verse_text(verse):
+    # get_verse_text() for a CompactVerse, using the vocabulary's normalized words
+    vocabulary = verse.vocabulary
+    return " ".join([vocabulary.normalized(word_id) for word_id in verse.token_ids]).rstrip()
+
+
+@dataclasses.dataclass
+class DiffStats:
+    # counts kept by the word-mode diff functions when they are passed one
+    diffs: int = 0
+    # diffs that ran out of their Diff_Budget and may be less than minimal
+    budget_exhausted: int = 0
+    # diff_bisect calls, and halfMatch splits that were taken instead of bisecting the whole text
+    bisect_calls: int = 0
+    half_matches: int = 0
+
+    def record(self, differ):
+        self.diffs += 1
+        if differ.Diff_BudgetExhausted:
+            self.budget_exhausted += 1
+        self.bisect_calls += differ.Diff_BisectCalls
+        self.half_matches += differ.Diff_HalfMatches
+
+
+# added RWB 2023-10-21 for word-level diffs
+# budget, if > 0, replaces the 1 second Diff_Timeout with a Diff_Budget, so the diff doesn't depend on machine load
+def diff_wordMode(text1, text2, budget=0, stats=None):
+    dmp = dmp_module.diff_match_patch()
+    dmp.Diff_Budget = budget
+    initial_diff = dmp.diff_linesToWords(text1, text2)
+    wordText1 = initial_diff[0]
+    wordText2 = initial_diff[1]
+    lineArray = initial_diff[2]
+    diffs = dmp.diff_main(wordText1, wordText2, False)
+    if stats is not None:
+        stats.record(dmp)
+    dmp.diff_charsToLines(diffs, lineArray)
+    # diff_cleanupSemantic() causes issues when comparing word-level
+    # dmp.diff_cleanupSemantic(diffs)
+    return diffs
+
+
+@dataclasses.dataclass(slots=True)
+class InternedVerse:
+    identifier: str
+    usfm: str
+    # the normalized verse text, encoded once: a str with one character per word from encode_verse_text(),
+    # or a tuple of word ids from encode_verse_ids()
+    tokens: str | tuple
+
+
+def encode_verse_text(text, vocabulary):
+    # diff_linesToWords() for one text against a persistent Vocabulary, so each verse is split and hashed
+    # once and every edition sharing the vocabulary gets the same character for the same word
+    return dmp_module.diff_match_patch().diff_wordsToChars(text, vocabulary.words, vocabulary.ids)
+
+
+def encode_verse_ids(text, vocabulary):
+    # encode_verse_text() as a tuple of word ids, for the diff_sequence engine
+    return vocabulary.encode(text)
+
+
+def intern_verses(verses, vocabulary, verse_text=get_verse_text, encode=encode_verse_text):
+    for verse in verses:
+        yield InternedVerse(verse.identifier, verse.usfm, encode(verse_text(verse), vocabulary))
+
+
+def interned_verse_text(verse):
+    # equal encodings mean equal texts, so this stands in for the text in compare_verse_pair()
+    return verse.tokens
+
+
+def interned_text(tokens, vocabulary):
+    # the normalized text an encode_verse_text() / encode_verse_ids() encoding came from
+    if isinstance(tokens, str):
+        return "".join([vocabulary.words[ord(char)] for char in tokens])
+    return "".join([vocabulary.words[word_id] for word_id in tokens])
+
+
+def diff_internedWordMode(chars1, chars2, vocabulary, budget=0, stats=None):
+    # diff_wordMode() on two texts already encoded against vocabulary
+    dmp = dmp_module.diff_match_patch()
+    dmp.Diff_Budget = budget
+    diffs = dmp.diff_main(chars1, chars2, False)
+    if stats is not None:
+        stats.record(dmp)
+    dmp.diff_charsToLines(diffs, vocabulary.words)
+    return diffs
+
+
+def diff_sequenceWordMode(ids1, ids2, vocabulary, budget=0, stats=None):
+    # diff_wordMode() on two tuples of word ids, using the integer-sequence engine
+    differ = diff_sequence.SequenceDiff()
+    differ.Diff_Budget = budget
+    diffs = differ.diff_main(ids1, ids2)
+    if stats is not None:
+        stats.record(differ)
+    return diff_sequence.diff_text(diffs, vocabulary.words)
+
+
+def engine_encoding(engine):
+    # (encode, diff) for an --engine choice: how verses are interned, and the word-mode diff of two encodings
+    if engine == "sequence":
+        return encode_verse_ids, diff_sequenceWordMode
+    return encode_verse_text, diff_internedWordMode
+
+
+# statuses for a VerseComparison
+MATCH = "match"
+DIFFERENCE = "diff"
+SOURCE_ONLY = "source-only"
+COMPARE_ONLY = "compare-only"
+
+
+@dataclasses.dataclass
+class VerseComparison:
+    identifier: str
+    usfm: str
+    status: str
+    # diff_wordMode() output, only set when status is DIFFERENCE
+    diff: list = None
+    # with --span, (op, text, other verse identifier) for equal text the other edition has in a different verse
+    moved: list = None
+    # (text, delete index, insert index) into diff for each run the other edition has in a different order
+    transposed: list = None
+
+
+def compare_verse_pair(source_verse, compare_verse, verse_text=get_verse_text, diff=diff_wordMode,
+                       verse_digest=None):
+    # either side may be None when the verse is missing from that edition.
+    # verse_text turns a verse into its normalized text, get_verse_text() for Verse objects,
+    # and diff is called on two of those texts. verse_digest, if given, returns text_digest() of that
+    # text, so verses with equal digests are matched without their text ever being built.
+    if compare_verse is None:
+        return VerseComparison(source_verse.identifier, source_verse.usfm, SOURCE_ONLY)
+    if source_verse is None:
+        return VerseComparison(compare_verse.identifier, compare_verse.usfm, COMPARE_ONLY)
+
+    # if the verses are exact, we skip everything and log it
+    if verse_digest is not None and verse_digest(source_verse) == verse_digest(compare_verse):
+        return VerseComparison(source_verse.identifier, source_verse.usfm, MATCH)
+    source_gnt_verse_text = verse_text(source_verse)
+    compare_gnt_verse_text = verse_text(compare_verse)
+    # (digests that differ mean the texts do too)
+    if verse_digest is None and source_gnt_verse_text == compare_gnt_verse_text:
+        return VerseComparison(source_verse.identifier, source_verse.usfm, MATCH)
+
+    # do the diff
+    #  0 == text that matches between editions
+    # -1 == text that is in source_edition but not compare_edition
+    #  1 == text that is in compare_edition but not source_edition
+    return VerseComparison(source_verse.identifier, source_verse.usfm, DIFFERENCE,
+                           diff(source_gnt_verse_text, compare_gnt_verse_text))
+
+
+def iter_comparisons(source_gnt_lines, compare_gnt_lines, verse_text=get_verse_text, diff=diff_wordMode,
+                     verse_digest=None):
+    # both source_gnt_lines and compare_gnt_lines are dict[Verse.identifier, Verse] so verses can be sorted properly
+    # get keys from source_gnt_lines and sort
+    # because I don't know if dicts in python preserve order
+    source_gnt_keys = list(source_gnt_lines.keys())
+    source_gnt_keys.sort()
+    for source_gnt_verse in source_gnt_keys:
+        yield compare_verse_pair(source_gnt_lines[source_gnt_verse], compare_gnt_lines.get(source_gnt_verse),
+                                 verse_text, diff, verse_digest)
+
+    # we also need to find the compare_edition verses that are not in source_edition (e.g. 3Jn 1:15)
+    for compare_verse in compare_gnt_lines:
+        if not source_gnt_lines.__contains__(compare_verse):
+            yield compare_verse_pair(None, compare_gnt_lines[compare_verse], verse_text, diff, verse_digest)
+
+
+def merge_verses(source_verses, compare_verses):
+    # merge-join two verse streams that are both in BCV order. yields (source_verse, compare_verse) pairs,
+    # with None on the side that doesn't have the verse, so each verse is seen exactly once.
+    def next_verse(verses, previous):
+        verse = next(verses, None)
+        if verse is not None and previous is not None and verse.identifier <= previous.identifier:
+            raise ValueError(f"Verses out of BCV order: {verse.identifier} after {previous.identifier}")
+        return verse
+
+    source_verses = iter(source_verses)
+    compare_verses = iter(compare_verses)
+    source_verse = next_verse(source_verses, None)
+    compare_verse = next_verse(compare_verses, None)
+    while source_verse is not None or compare_verse is not None:
+        if compare_verse is None or (source_verse is not None and source_verse.identifier < compare_verse.identifier):
+            yield source_verse, None
+            source_verse = next_verse(source_verses, source_verse)
+        elif source_verse is None or compare_verse.identifier < source_verse.identifier:
+            yield None, compare_verse
+            compare_verse = next_verse(compare_verses, compare_verse)
+        else:
+            yield source_verse, compare_verse
+            source_verse = next_verse(source_verses, source_verse)
+            compare_verse = next_verse(compare_verses, compare_verse)
+
+
+def iter_merge_comparisons(source_verses, compare_verses, verse_text=get_verse_text, diff=diff_wordMode,
+                           verse_digest=None):
+    for source_verse, compare_verse in merge_verses(source_verses, compare_verses):
+        yield compare_verse_pair(source_verse, compare_verse, verse_text, diff, verse_digest)
+
+
+def parse_verse_range(text):
+    # (start, end) verse id prefixes from "START-END" or a single "PREFIX", e.g. 40005-40007 for Matthew 5-7
+    start, _, end = text.partition('-')
+    end = end or start
+    if not (start.isdigit() and end.isdigit()):
+        raise ValueError(f"Expected a verse id range like 40005-40007, got {text!r}")
+    return start, end
+
+
+def in_verse_range(identifier, verse_range):
+    start, end = verse_range
+    return start <= identifier[:len(start)] and identifier[:len(end)] <= end
+
+
+def report(comparisons, source_edition, compare_edition, transpositions=True, writer=None):
+    # some counters
+    verse_match_count = 0
+    verse_difference_count = 0
+
+    if transpositions:
+        comparisons = word_order.iter_transpositions(comparisons)
+    for comparison in comparisons:
+        if writer is not None:
+            # structured records instead of the printed report; only the counts are printed
+            writer.write(comparison, source_edition, compare_edition)
+            if comparison.status == MATCH:
+                verse_match_count += 1
+            elif comparison.status == DIFFERENCE:
+                verse_difference_count += 1
+            continue
+        if comparison.status == COMPARE_ONLY:
+            print(f"{compare_edition} {comparison.usfm} ({compare_edition}) not in {source_edition}")
+            if comparison.moved:
+                print(f"Moved across verse boundaries: {comparison.moved}")
+            continue
+        print(f"Current: {comparison.usfm} ({comparison.identifier})")
+        if comparison.status == MATCH:
+            print("Exact match for " + comparison.identifier)
+            verse_match_count += 1
+        elif comparison.status == DIFFERENCE:
+            verse_difference_count += 1
+            print(comparison.diff)
+            if comparison.transposed:
+                print(f"Transposed: {[text for text, delete_index, insert_index in comparison.transposed]}")
+        else:
+            print(f"{source_edition} {comparison.usfm} ({comparison.identifier}) not in {compare_edition}")
+        if comparison.moved:
+            print(f"Moved across verse boundaries: {comparison.moved}")
+
+    print(f"Verse match count: {verse_match_count}")
+    print(f"Verse difference count: {verse_difference_count}")
+
+
+# some globals
+# the repository root, which holds data/tsv. found from where this file sits in it (code/python/bible-comparison)
+# unless BIBLE_COMPARISON_DIR names another one
+git_dir = os.environ.get("BIBLE_COMPARISON_DIR") or (
+    os.path.abspath(os.path.join(os.path.dirname(__file__), "..", "..", "..")).replace("\\", "/") + "/")
@@ -0,0 +1,208 @@
+"""Serve verse comparisons over local HTTP from editions held in memory.
+
+The editions are loaded once into a ComparisonSession at startup, so a query
+only costs its diffs, and diffs already made are answered from an LRU cache
+keyed on the two interned verse texts. Stdlib only, on a TCP port or, with
+--unix, a Unix socket. Every response is JSON.
+
+- GET /compare?range=40005-40007[&source=n1904&compare=sblgnt][&diffs_only=1]
+  compares a range of verse id prefixes (see comparison_session). The
+  comparisons are comparison_writer records, the same as --output writes.
+- GET /verse?id=40014027[&source=...&compare=...] compares one verse.
+- GET /health returns the status and the editions loaded.
+- GET /metrics returns the request counts per path (any path not listed here
+  counts as "other"), error count, time spent answering, diffs made, and the
+  diff cache's hits, misses and size.
+
+    python comparison_server.py [--port 8765 | --unix PATH] [--editions A B ...] [--cache-size N]
+
+    curl 'http://127.0.0.1:8765/verse?id=40014027'
+"""
+
+import argparse
+import functools
+import http.server
+import json
+import os
+import socketserver
+import threading
+import time
+import urllib.parse
+
+import comparison_session
+import comparison_writer
+
+
+DEFAULT_PORT = 8765
+# verse diffs kept in the LRU cache
+DEFAULT_CACHE_SIZE = 8192
+# paths counted by name in /metrics; every other path is counted as "other"
+PATHS = ("/compare", "/verse", "/health", "/metrics")
+
+
+class ServerState:
+    def __init__(self, session, cache_size, load_seconds):
+        self.session = session
+        # diffs are keyed on the interned texts of both verses, so equal verse pairs share an entry
+        session.diff = functools.lru_cache(maxsize=cache_size)(session.diff)
+        self.load_seconds = load_seconds
+        self.started = time.time()
+        # the session's vocabulary and stats aren't thread safe, so comparisons take turns
+        self.lock = threading.Lock()
+        # the request counters are updated from every handler thread, under their own lock
+        self.counter_lock = threading.Lock()
+        self.requests = {}
+        self.errors = 0
+        self.seconds = 0.0
+
+    def count_request(self, path):
+        path = path if path in PATHS else "other"
+        with self.counter_lock:
+            self.requests[path] = self.requests.get(path, 0) + 1
+
+    def count_error(self):
+        with self.counter_lock:
+            self.errors += 1
+
+    def count_seconds(self, seconds):
+        with self.counter_lock:
+            self.seconds += seconds
+
+    def compare(self, verse_range, source, compare, diffs_only):
+        session = self.session
+        source = source or session.editions[0]
+        compare = compare or session.editions[1]
+        for edition in (source, compare):
+            if edition not in session.verses:
+                raise ValueError(f"Edition {edition!r} isn't loaded; the server has {session.editions}")
+        with self.lock:
+            comparisons = (session.iter_diffs if diffs_only else session.compare)(verse_range, source, compare)
+            records = [comparison_writer.comparison_record(comparison, source, compare)
+                       for comparison in comparisons]
+        return {"source": source, "compare": compare, "range": verse_range, "comparisons": records}
+
+    def health(self):
+        return {"status": "ok", "editions": {edition: len(verses) for edition, verses in
+                                             self.session.verses.items()}}
+
+    def metrics(self):
+        cache_info = self.session.diff.cache_info()
+        with self.counter_lock:
+            requests = dict(self.requests)
+            errors = self.errors
+            seconds = self.seconds
+        return {"uptime_seconds": round(time.time() - self.started, 3),
+                "load_seconds": round(self.load_seconds, 3),
+                "requests": requests, "errors": errors,
+                "request_seconds": round(seconds, 6),
+                "diffs": self.session.stats.diffs,
+                "diff_cache": {"hits": cache_info.hits, "misses": cache_info.misses,
+                               "size": cache_info.currsize, "max_size": cache_info.maxsize}}
+
+
+class ComparisonHandler(http.server.BaseHTTPRequestHandler):
+    def do_GET(self):
+        state = self.server.state
+        start = time.perf_counter()
+        url = urllib.parse.urlsplit(self.path)
+        query = {name: values[-1] for name, values in urllib.parse.parse_qs(url.query).items()}
+        state.count_request(url.path)
+        try:
+            if url.path == "/compare":
+                body = state.compare(query.get("range"), query.get("source"), query.get("compare"),
+                                     query.get("diffs_only", "0") not in ("", "0"))
+            elif url.path == "/verse":
+                identifier = query.get("id", "")
+                if not (identifier.isdigit() and len(identifier) == 8):
+                    raise ValueError(f"Expected an 8 digit verse id, got {identifier!r}")
+                body = state.compare(identifier, query.get("source"), query.get("compare"), False)
+            elif url.path == "/health":
+                body = state.health()
+            elif url.path == "/metrics":
+                body = state.metrics()
+            else:
+                state.count_error()
+                self.send_json(404, {"error": f"Unknown path {url.path}"})
+                return
+        except ValueError as error:
+            state.count_error()
+            self.send_json(400, {"error": str(error)})
+            return
+        self.send_json(200, body)
+        state.count_seconds(time.perf_counter() - start)
+
+    def send_json(self, status, body):
+        data = json.dumps(body, ensure_ascii=False).encode('utf-8')
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json; charset=utf-8")
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def address_string(self):
+        # a Unix socket client has no host
+        return self.client_address[0] if self.client_address else "unix"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+
+class ComparisonHTTPServer(http.server.ThreadingHTTPServer):
+    def __init__(self, address, state, verbose=False):
+        super().__init__(address, ComparisonHandler)
+        self.state = state
+        self.verbose = verbose
+
+
+class ComparisonUnixServer(socketserver.ThreadingUnixStreamServer):
+    daemon_threads = True
+
+    def __init__(self, path, state, verbose=False):
+        if os.path.exists(path):
+            os.remove(path)
+        super().__init__(path, ComparisonHandler)
+        self.state = state
+        self.verbose = verbose
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Serve verse comparisons from editions held in memory.")
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=DEFAULT_PORT)
+    parser.add_argument("--unix", metavar="PATH", help="listen on this Unix socket instead of a TCP port")
+    parser.add_argument("--editions", nargs="+", default=["n1904", "sblgnt"], metavar="EDITION",
+                        help="editions to load (data/tsv/EDITION-verses.tsv); the first two are compared by default")
+    parser.add_argument("--data-dir", help="directory holding the EDITION-verses.tsv files")
+    parser.add_argument("--engine", choices=["dmp", "sequence"], default="dmp")
+    parser.add_argument("--cache-dir", help="load the editions through edition_cache files in this directory")
+    parser.add_argument("--cache-size", type=int, default=DEFAULT_CACHE_SIZE,
+                        help="verse diffs kept in the in-memory LRU cache")
+    parser.add_argument("--verbose", action="store_true", help="log every request")
+    args = parser.parse_args()
+    if len(args.editions) < 2:
+        parser.error("--editions needs at least two editions")
+
+    start = time.perf_counter()
+    session = comparison_session.ComparisonSession(args.editions, args.data_dir, args.engine, cache_dir=args.cache_dir,
+                                                   verbose=True)
+    state = ServerState(session, args.cache_size, time.perf_counter() - start)
+    if args.unix:
+        server = ComparisonUnixServer(args.unix, state, args.verbose)
+        where = args.unix
+    else:
+        server = ComparisonHTTPServer((args.host, args.port), state, args.verbose)
+        where = f"http://{args.host}:{server.server_address[1]}"
+    print(f"Loaded {', '.join(args.editions)} in {state.load_seconds:.1f}s; serving on {where}", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        if args.unix and os.path.exists(args.unix):
+            os.remove(args.unix)
+
+
+if __name__ == "__main__":
+    main()
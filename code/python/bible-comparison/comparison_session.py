@@ -0,0 +1,102 @@
+"""Compare editions from other Python code, loading each edition only once.
+
+A ComparisonSession loads its editions when it is created. Each verse is
+normalized and interned into one vocabulary shared by every edition, as
+--intern does, and the editions then stay resident. Each compare() or
+iter_diffs() call after that only costs the diffs of the verses asked for.
+
+    session = ComparisonSession(["n1904", "sblgnt"], data_dir="data/tsv")
+    for comparison in session.compare("40005-40007"):
+        ...
+    for comparison in session.iter_diffs("43"):
+        print(comparison.usfm, comparison.diff)
+
+Verse ranges are verse id prefixes as in --profile: "40005-40007" is
+Matthew 5-7, "43" is John and "40014027" is Matt 14:27. No range means every
+verse. The results are the same VerseComparison objects report() prints,
+with transpositions filled in unless the session is made with
+transpositions=False. Comparisons use the session's first two editions
+unless source and compare name others.
+
+data_dir is the directory holding EDITION-verses.tsv. It defaults to the
+repository's data/tsv, or data/tsv under BIBLE_COMPARISON_DIR. Loading is
+quiet unless verbose=True.
+"""
+
+import bisect
+import contextlib
+import functools
+import io
+import os
+
+import comparison_core
+import edition_cache
+import word_order
+
+
+class ComparisonSession:
+    def __init__(self, editions=("n1904", "sblgnt"), data_dir=None, engine="dmp", budget=0, cache_dir=None,
+                 transpositions=True, verbose=False):
+        if len(editions) < 2:
+            raise ValueError("A ComparisonSession needs at least two editions")
+        self.editions = list(editions)
+        self.data_dir = data_dir
+        self.transpositions = transpositions
+        self.vocabulary = comparison_core.Vocabulary()
+        self.stats = comparison_core.DiffStats()
+        encode, diff_encoded = comparison_core.engine_encoding(engine)
+        self.diff = functools.partial(diff_encoded, vocabulary=self.vocabulary, budget=budget, stats=self.stats)
+        # edition: {identifier: InternedVerse}
+        self.verses = {}
+        # edition: sorted identifiers, for finding a verse range by bisection
+        self.identifiers = {}
+        with contextlib.nullcontext() if verbose else contextlib.redirect_stdout(io.StringIO()):
+            for edition in self.editions:
+                if cache_dir:
+                    verses = edition_cache.load_edition(edition, self.edition_file_name(edition), cache_dir).verses()
+                    verse_text = edition_cache.cached_verse_text
+                else:
+                    verses = comparison_core.iter_verses(edition, self.edition_file_name(edition))
+                    verse_text = comparison_core.get_verse_text
+                self.verses[edition] = {verse.identifier: verse for verse in
+                                        comparison_core.intern_verses(verses, self.vocabulary, verse_text, encode)}
+                self.identifiers[edition] = sorted(self.verses[edition])
+
+    def edition_file_name(self, edition):
+        file_name = f"{edition}-verses.tsv"
+        return file_name if self.data_dir is None else os.path.join(self.data_dir, file_name)
+
+    def range_identifiers(self, edition, verse_range):
+        # sorted identifiers of an edition's verses in a range, found by bisection
+        identifiers = self.identifiers[edition]
+        if verse_range is None:
+            return identifiers
+        start, end = comparison_core.parse_verse_range(verse_range) if isinstance(verse_range, str) else verse_range
+        # identifiers are fixed-width digit strings, so "~" sorts after every identifier that starts with end
+        return identifiers[bisect.bisect_left(identifiers, start):bisect.bisect_right(identifiers, end + "~")]
+
+    def iter_comparisons(self, verse_range=None, source=None, compare=None):
+        # VerseComparisons of every verse in the range, in BCV order, including verses only one edition has
+        source = source or self.editions[0]
+        compare = compare or self.editions[1]
+        source_verses = self.verses[source]
+        compare_verses = self.verses[compare]
+        identifiers = sorted(set(self.range_identifiers(source, verse_range)).union(
+            self.range_identifiers(compare, verse_range)))
+        comparisons = (comparison_core.compare_verse_pair(source_verses.get(identifier),
+                                                          compare_verses.get(identifier),
+                                                          comparison_core.interned_verse_text, self.diff)
+                       for identifier in identifiers)
+        if self.transpositions:
+            comparisons = word_order.iter_transpositions(comparisons)
+        return comparisons
+
+    def compare(self, verse_range=None, source=None, compare=None):
+        # list of iter_comparisons()
+        return list(self.iter_comparisons(verse_range, source, compare))
+
+    def iter_diffs(self, verse_range=None, source=None, compare=None):
+        # only the verses whose text differs
+        for comparison in self.iter_comparisons(verse_range, source, compare):
+            if comparison.status == comparison_core.DIFFERENCE:
+                yield comparison
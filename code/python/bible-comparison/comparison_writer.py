@@ -0,0 +1,139 @@
+"""Write verse comparisons as JSONL or TSV records.
+
+report() prints a Current: line and a Python repr of the diff for every verse,
+which downstream jobs have to parse back. ComparisonWriter writes one record
+per verse pair instead. A record holds:
+- the two editions, the verse id, USFM reference and status
+  (match, diff, source-only or compare-only)
+- for a difference, every op of the diff with its token span in each
+  edition and the first and last word identifier of that span
+Word identifiers are the verse id plus the word's 1-based position, zero
+padded to three digits, as in Word.identifier. Records are buffered and
+written in bulk.
+
+JSONL records are objects, e.g.
+{"source": "n1904", "compare": "sblgnt", "id": "40014027", "usfm": "MAT 14:27", "status": "diff",
+ "ops": [{"op": 0, "text": "εὐθυς δε ἐλαλησεν ", "source": [0, 3], "compare": [0, 3],
+          "source_words": ["40014027001", "40014027003"], "compare_words": ["40014027001", "40014027003"]}, ...],
+ "transposed": [["αὐτοις", 3, 1]]}
+
+TSV has one row per verse with the columns in TSV_COLUMNS. Ops are separated
+by " | ". Each op is "op source_start:source_end compare_start:compare_end
+source_words compare_words text", where a word range is "first-last" or "-"
+when empty.
+"""
+
+import json
+
+import comparison_core
+import diff_sequence
+
+
+DIFF_DELETE = diff_sequence.DIFF_DELETE
+DIFF_INSERT = diff_sequence.DIFF_INSERT
+
+FORMATS = ["jsonl", "tsv"]
+TSV_COLUMNS = ["source", "compare", "id", "usfm", "status", "ops", "transposed", "moved"]
+# records held before they are written in one go
+BUFFER_RECORDS = 4096
+
+
+def token_count(text):
+    # words in a diff op's text, counted the way Vocabulary.encode() splits a verse: each space ends a word
+    if not text:
+        return 0
+    return text.count(' ') + (0 if text.endswith(' ') else 1)
+
+
+def word_range(identifier, start, end):
+    # [first, last] word identifier of the tokens start:end of a verse, or None if there are none
+    if start == end:
+        return None
+    return [identifier + str(start + 1).zfill(3), identifier + str(end).zfill(3)]
+
+
+def diff_ops(identifier, diff):
+    # the ops of a verse diff with their token spans and word identifiers in each edition
+    ops = []
+    position1 = 0
+    position2 = 0
+    for op, text in diff:
+        length = token_count(text)
+        end1 = position1 if op == DIFF_INSERT else position1 + length
+        end2 = position2 if op == DIFF_DELETE else position2 + length
+        ops.append({"op": op, "text": text, "source": [position1, end1], "compare": [position2, end2],
+                    "source_words": word_range(identifier, position1, end1),
+                    "compare_words": word_range(identifier, position2, end2)})
+        position1 = end1
+        position2 = end2
+    return ops
+
+
+def comparison_record(comparison, source_edition, compare_edition):
+    record = {"source": source_edition, "compare": compare_edition, "id": comparison.identifier,
+              "usfm": comparison.usfm, "status": comparison.status}
+    if comparison.diff is not None:
+        record["ops"] = diff_ops(comparison.identifier, comparison.diff)
+    if comparison.transposed:
+        record["transposed"] = comparison.transposed
+    if comparison.moved:
+        record["moved"] = comparison.moved
+    return record
+
+
+def jsonl_line(record):
+    return json.dumps(record, ensure_ascii=False) + "\n"
+
+
+def tsv_word_range(words):
+    return "-" if words is None else f"{words[0]}-{words[1]}"
+
+
+def tsv_line(record):
+    ops = " | ".join([f"{op['op']} {op['source'][0]}:{op['source'][1]} {op['compare'][0]}:{op['compare'][1]} "
+                      f"{tsv_word_range(op['source_words'])} {tsv_word_range(op['compare_words'])} {op['text']}"
+                      for op in record.get("ops", [])])
+    transposed = " | ".join([f"{delete_index}:{insert_index} {text}"
+                             for text, delete_index, insert_index in record.get("transposed", [])])
+    moved = " | ".join([f"{op} {other} {text}" for op, text, other in record.get("moved", [])])
+    return "\t".join([record["source"], record["compare"], record["id"], record["usfm"], record["status"],
+                      ops, transposed, moved]) + "\n"
+
+
+class ComparisonWriter:
+    def __init__(self, path, output_format="jsonl", skip_matches=False):
+        if output_format not in FORMATS:
+            raise ValueError(f"Unknown output format {output_format!r}, expected one of {FORMATS}")
+        self.path = path
+        self.skip_matches = skip_matches
+        self.format_record = tsv_line if output_format == "tsv" else jsonl_line
+        self.outfile = open(path, 'w', encoding='utf-8', newline='\n')
+        self.buffer = []
+        self.records = 0
+        if output_format == "tsv":
+            self.outfile.write("\t".join(TSV_COLUMNS) + "\n")
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def write(self, comparison, source_edition, compare_edition):
+        if self.skip_matches and comparison.status == comparison_core.MATCH:
+            return
+        self.buffer.append(self.format_record(comparison_record(comparison, source_edition, compare_edition)))
+        self.records += 1
+        if len(self.buffer) >= BUFFER_RECORDS:
+            self.flush()
+
+    def flush(self):
+        self.outfile.write("".join(self.buffer))
+        self.buffer = []
+
+    def close(self):
+        if self.outfile is None:
+            return
+        self.flush()
+        self.outfile.close()
+        self.outfile = None
@@ -0,0 +1,132 @@
+"""Persistent cache of verse diffs for incremental re-runs.
+
+A diff is stored under a key made from the hashes of the two normalized verse
+texts and of the settings that produced it (diff algorithm, diff timeout or
+budget, normalization). Correcting a few verses in an edition TSV therefore only
+misses on the pairs whose text actually changed; every other pair is read
+back instead of re-diffed.
+
+The cache is one SQLite file. Each entry records its size and when it was
+last used, and when the file grows past its byte limit the least recently
+used entries are evicted. Writes and last-used updates are batched and
+applied when the cache is flushed or closed.
+"""
+
+import hashlib
+import json
+import sqlite3
+import time
+
+import edition_cache
+
+
+CACHE_VERSION = 2
+DEFAULT_MAX_BYTES = 64 * 1024 * 1024
+# pending inserts are written in batches of this many
+FLUSH_SIZE = 1000
+
+
+# the diffs an --engine gives: dmp and sequence are the same Myers diff (engine_check.py checks this), so they
+# share entries
+ENGINE_ALGORITHMS = {"dmp": "myers", "sequence": "myers"}
+
+
+def engine_settings(engine, timeout=1.0, budget=0):
+    # anything that can change a diff has to change the key. a diff cut short by the wall-clock timeout
+    # (budget 0) depends on how loaded the machine was, and is cached and reused as it came out; only
+    # a --diff-budget run is fully deterministic
+    return {"version": CACHE_VERSION, "algorithm": ENGINE_ALGORITHMS[engine], "timeout": timeout, "budget": budget,
+            "normalization": edition_cache.normalization_settings()}
+
+
+def text_hash(text):
+    return hashlib.blake2b(text.encode('utf-8'), digest_size=16).digest()
+
+
+class DiffCache:
+    def __init__(self, path, settings, max_bytes=DEFAULT_MAX_BYTES):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.settings_hash = text_hash(json.dumps(settings, sort_keys=True))
+        self.connection = sqlite3.connect(path)
+        self.connection.execute("CREATE TABLE IF NOT EXISTS diffs (key BLOB PRIMARY KEY, diff TEXT NOT NULL, "
+                                "size INTEGER NOT NULL, used REAL NOT NULL)")
+        self.connection.execute("CREATE INDEX IF NOT EXISTS diffs_used ON diffs (used)")
+        self.connection.commit()
+        self.pending = []
+        self.used = []
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def key(self, text1, text2):
+        return hashlib.blake2b(self.settings_hash + text_hash(text1) + text_hash(text2), digest_size=16).digest()
+
+    def get(self, key):
+        row = self.connection.execute("SELECT diff FROM diffs WHERE key = ?", (key,)).fetchone()
+        if row is None:
+            return None
+        self.used.append(key)
+        return [(op, text) for op, text in json.loads(row[0])]
+
+    def put(self, key, diffs):
+        data = json.dumps(diffs, ensure_ascii=False)
+        self.pending.append((key, data, len(key) + len(data.encode('utf-8'))))
+        if len(self.pending) >= FLUSH_SIZE:
+            self.flush()
+
+    def cached(self, diff, verse_text=None):
+        # wrap diff(text1, text2) so results come from the cache when they can. verse_text maps diff's
+        # arguments back to normalized verse text when they are something else (e.g. interned tokens).
+        def cached_diff(text1, text2):
+            key = self.key(verse_text(text1), verse_text(text2)) if verse_text else self.key(text1, text2)
+            diffs = self.get(key)
+            if diffs is not None:
+                self.hits += 1
+                return diffs
+            self.misses += 1
+            diffs = diff(text1, text2)
+            self.put(key, diffs)
+            return diffs
+        return cached_diff
+
+    def flush(self):
+        now = time.time()
+        with self.connection:
+            self.connection.executemany("INSERT OR REPLACE INTO diffs VALUES (?, ?, ?, ?)",
+                                        [(key, data, size, now) for key, data, size in self.pending])
+            self.connection.executemany("UPDATE diffs SET used = ? WHERE key = ?", [(now, key) for key in self.used])
+        self.pending = []
+        self.used = []
+
+    def evict(self):
+        # drop least recently used entries until the cache fits in max_bytes
+        (total,) = self.connection.execute("SELECT COALESCE(SUM(size), 0) FROM diffs").fetchone()
+        if total <= self.max_bytes:
+            return
+        evicted = []
+        for key, size in self.connection.execute("SELECT key, size FROM diffs ORDER BY used"):
+            if total <= self.max_bytes:
+                break
+            evicted.append((key,))
+            total -= size
+        with self.connection:
+            self.connection.executemany("DELETE FROM diffs WHERE key = ?", evicted)
+        self.evictions += len(evicted)
+
+    def close(self):
+        if self.connection is None:
+            return
+        self.flush()
+        self.evict()
+        self.connection.close()
+        self.connection = None
+
+    def summary(self):
+        return f"Diff cache: {self.hits} hits, {self.misses} misses, {self.evictions} evicted"
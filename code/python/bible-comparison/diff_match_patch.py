@@ -25,6 +25,7 @@ Applies the patch onto another text, allowing for errors.
 
 __author__ = 'fraser@google.com (Neil Fraser)'
 
+import bisect
 import re
 import sys
 import time
@@ -44,6 +45,22 @@ class diff_match_patch:
 
     # Number of seconds to map a diff before giving up (0 for infinity).
     self.Diff_Timeout = 1.0
+    # Work budget to map a diff before giving up, in diagonals explored by
+    # diff_bisect (0 to use Diff_Timeout).  Used in place of the wall clock
+    # deadline, so the same texts always give the same diff however loaded the
+    # machine is.  Diff_Timeout > 0 still enables the halfMatch speedup.
+    self.Diff_Budget = 0
+    # Diagonals left in the budget, and whether the last diff_main ran out.
+    self.Diff_BudgetLeft = 0
+    self.Diff_BudgetExhausted = False
+    # Calls to diff_bisect and halfMatch splits taken by the last diff_main,
+    # for instrumentation.
+    self.Diff_BisectCalls = 0
+    self.Diff_HalfMatches = 0
+    # Combined length of two texts above which they are split at their common
+    # unique characters before diff_bisect (0 to never split).  Makes long
+    # texts such as whole chapters tractable, at the cost of minimality.
+    self.Diff_AnchorLength = 0
     # Cost of an empty edit operation in terms of edit characters.
     self.Diff_EditCost = 4
     # At what point is no match declared (0.0 = perfection, 1.0 = very loose).
@@ -86,15 +103,23 @@ class diff_match_patch:
         a line-level diff first to identify the changed areas.
         Defaults to true, which does a faster, slightly less optimal diff.
       deadline: Optional time when the diff should be complete by.  Used
-        internally for recursive calls.  Users should set DiffTimeout instead.
+        internally for recursive calls.  Users should set DiffTimeout or
+        Diff_Budget instead.
 
     Returns:
       Array of changes.
     """
     # Set a deadline by which time the diff must be complete.
     if deadline == None:
+      self.Diff_BisectCalls = 0
+      self.Diff_HalfMatches = 0
+      if self.Diff_Budget > 0:
+        # Work is counted instead; diff_bisect spends the budget.
+        self.Diff_BudgetLeft = self.Diff_Budget
+        self.Diff_BudgetExhausted = False
+        deadline = sys.maxsize
       # Unlike in most languages, Python counts time in seconds.
-      if self.Diff_Timeout <= 0:
+      elif self.Diff_Timeout <= 0:
         deadline = sys.maxsize
       else:
         deadline = time.time() + self.Diff_Timeout
@@ -182,6 +207,7 @@ class diff_match_patch:
     hm = self.diff_halfMatch(text1, text2)
     if hm:
       # A half-match was found, sort out the return data.
+      self.Diff_HalfMatches += 1
       (text1_a, text1_b, text2_a, text2_b, mid_common) = hm
       # Send both pairs off for separate processing.
       diffs_a = self.diff_main(text1_a, text2_a, checklines, deadline)
@@ -192,8 +218,86 @@ class diff_match_patch:
     if checklines and len(text1) > 100 and len(text2) > 100:
       return self.diff_lineMode(text1, text2, deadline)
 
+    if 0 < self.Diff_AnchorLength < len(text1) + len(text2):
+      diffs = self.diff_anchorSplit(text1, text2, checklines, deadline)
+      if diffs is not None:
+        return diffs
+
+    self.Diff_BisectCalls += 1
     return self.diff_bisect(text1, text2, deadline)
 
+  def diff_anchorSplit(self, text1, text2, checklines, deadline):
+    """Split two long texts at the characters which occur exactly once in
+    each of them and in the same order in both (the anchors of a patience
+    diff), and diff the stretches between the anchors separately.
+    This speedup can produce non-minimal diffs.
+
+    Args:
+      text1: Old string to be diffed.
+      text2: New string to be diffed.
+      checklines: Speedup flag.  Passed on to diff_main.
+      deadline: Time when the diff should be complete by.
+
+    Returns:
+      Array of diff tuples, or None if the texts have no anchors.
+    """
+    anchors = self.diff_uniqueAnchors(text1, text2)
+    if not anchors:
+      return None
+    diffs = []
+    x = 0
+    y = 0
+    for (i, j) in anchors:
+      diffs += self.diff_main(text1[x:i], text2[y:j], checklines, deadline)
+      diffs.append((self.DIFF_EQUAL, text1[i:i + 1]))
+      x = i + 1
+      y = j + 1
+    diffs += self.diff_main(text1[x:], text2[y:], checklines, deadline)
+    return diffs
+
+  def diff_uniqueAnchors(self, text1, text2):
+    """Find the longest run of characters which occur exactly once in each
+    text, in increasing order in both.
+
+    Args:
+      text1: First string.
+      text2: Second string.
+
+    Returns:
+      Array of (index in text1, index in text2) tuples, in order.
+    """
+    # Index of each character, or -1 if it occurs more than once.
+    index1 = {}
+    for (i, char) in enumerate(text1):
+      index1[char] = -1 if char in index1 else i
+    index2 = {}
+    for (j, char) in enumerate(text2):
+      index2[char] = -1 if char in index2 else j
+    candidates = sorted((i, index2[char]) for (char, i) in index1.items()
+                        if i != -1 and index2.get(char, -1) != -1)
+
+    # Longest increasing subsequence of the text2 indexes (patience sort).
+    tails = []
+    tail_candidates = []
+    previous = [None] * len(candidates)
+    for (n, (i, j)) in enumerate(candidates):
+      k = bisect.bisect_left(tails, j)
+      if k == len(tails):
+        tails.append(j)
+        tail_candidates.append(n)
+      else:
+        tails[k] = j
+        tail_candidates[k] = n
+      if k:
+        previous[n] = tail_candidates[k - 1]
+    anchors = []
+    n = tail_candidates[-1] if tail_candidates else None
+    while n is not None:
+      anchors.append(candidates[n])
+      n = previous[n]
+    anchors.reverse()
+    return anchors
+
   def diff_lineMode(self, text1, text2, deadline):
     """Do a quick line-level diff on both strings, then rediff the parts for
       greater accuracy.
@@ -286,7 +390,7 @@ class diff_match_patch:
     k2end = 0
     for d in range(max_d):
       # Bail out if deadline is reached.
-      if time.time() > deadline:
+      if self.diff_deadlineReached(deadline, d):
         break
 
       # Walk the front path one step.
@@ -353,6 +457,26 @@ class diff_match_patch:
     # number of diffs equals number of characters, no commonality at all.
     return [(self.DIFF_DELETE, text1), (self.DIFF_INSERT, text2)]
 
+  def diff_deadlineReached(self, deadline, d):
+    """Check whether diff_bisect has to bail out before exploring edit
+    distance d.  With a Diff_Budget this spends the 2 * d + 2 diagonals the
+    forward and reverse paths are about to explore.
+
+    Args:
+      deadline: Time at which to bail if not yet complete.
+      d: Edit distance about to be explored.
+
+    Returns:
+      True if the deadline has passed or the budget is spent.
+    """
+    if self.Diff_Budget > 0:
+      self.Diff_BudgetLeft -= 2 * d + 2
+      if self.Diff_BudgetLeft < 0:
+        self.Diff_BudgetExhausted = True
+        return True
+      return False
+    return time.time() > deadline
+
   def diff_bisectSplit(self, text1, text2, x, y, deadline):
     """Given the location of the 'middle snake', split the diff in two parts
     and recurse.
@@ -461,51 +585,55 @@ class diff_match_patch:
     # So we'll insert a junk entry to avoid generating a null character.
     lineArray.append('')
 
-    def diff_linesToCharsMunge(text):
-      """Split a text into an array of strings.  Reduce the texts to a string
-      of hashes where each Unicode character represents one line.
-      Modifies linearray and linehash through being a closure.
-
-      Args:
-        text: String to encode.
+    # Allocate 2/3rds of the space for text1, the rest for text2.
+    chars1 = self.diff_wordsToChars(text1, lineArray, lineHash, 666666)
+    chars2 = self.diff_wordsToChars(text2, lineArray, lineHash, 1114111)
+    return (chars1, chars2, lineArray)
 
-      Returns:
-        Encoded string.
-      """
-      chars = []
-      # Walk the text, pulling out a substring for each line.
-      # text.split('\n') would would temporarily double our memory footprint.
-      # Modifying text would create many large strings to garbage collect.
-      lineStart = 0
-      lineEnd = -1
-      while lineEnd < len(text) - 1:
-        # lineEnd = text.find('\n', lineStart)
-        # look for whitespace, not line-ends, to support word lookup
-        # see: https://github.com/google/diff-match-patch/wiki/Line-or-Word-Diffs
-        lineEnd = text.find(' ', lineStart)
-        if lineEnd == -1:
-          lineEnd = len(text) - 1
-        line = text[lineStart:lineEnd + 1]
+  def diff_wordsToChars(self, text, lineArray, lineHash, maxLines=1114111):
+    """Split a text into words.  Reduce the text to a string of hashes where
+    each Unicode character represents one word.  The vocabulary is passed in
+    and extended in place, so a caller can keep one across many calls and
+    encode each text only once.
 
-        if line in lineHash:
-          chars.append(chr(lineHash[line]))
-        else:
-          if len(lineArray) == maxLines:
-            # Bail out at 1114111 because chr(1114112) throws.
-            line = text[lineStart:]
-            lineEnd = len(text)
-          lineArray.append(line)
-          lineHash[line] = len(lineArray) - 1
-          chars.append(chr(len(lineArray) - 1))
-        lineStart = lineEnd + 1
-      return "".join(chars)
+    Args:
+      text: String to encode.
+      lineArray: Array of unique strings.  The zeroth element should be the
+        blank junk entry.
+      lineHash: Dict mapping each string in lineArray to its index.
+      maxLines: Size of lineArray at which the rest of the text is lumped
+        into a single entry.
 
-    # Allocate 2/3rds of the space for text1, the rest for text2.
-    maxLines = 666666
-    chars1 = diff_linesToCharsMunge(text1)
-    maxLines = 1114111
-    chars2 = diff_linesToCharsMunge(text2)
-    return (chars1, chars2, lineArray)
+    Returns:
+      Encoded string.
+    """
+    chars = []
+    # Walk the text, pulling out a substring for each line.
+    # text.split('\n') would would temporarily double our memory footprint.
+    # Modifying text would create many large strings to garbage collect.
+    lineStart = 0
+    lineEnd = -1
+    while lineEnd < len(text) - 1:
+      # lineEnd = text.find('\n', lineStart)
+      # look for whitespace, not line-ends, to support word lookup
+      # see: https://github.com/google/diff-match-patch/wiki/Line-or-Word-Diffs
+      lineEnd = text.find(' ', lineStart)
+      if lineEnd == -1:
+        lineEnd = len(text) - 1
+      line = text[lineStart:lineEnd + 1]
+
+      if line in lineHash:
+        chars.append(chr(lineHash[line]))
+      else:
+        if len(lineArray) == maxLines:
+          # Bail out at 1114111 because chr(1114112) throws.
+          line = text[lineStart:]
+          lineEnd = len(text)
+        lineArray.append(line)
+        lineHash[line] = len(lineArray) - 1
+        chars.append(chr(len(lineArray) - 1))
+      lineStart = lineEnd + 1
+    return "".join(chars)
 
   def diff_charsToLines(self, diffs, lineArray):
     """Rehydrate the text in a diff from a string of line hashes to real lines
@@ -989,106 +1117,150 @@ class diff_match_patch:
     """Reorder and merge like edit sections.  Merge equalities.
     Any edit section can move as long as it doesn't cross an equality.
 
+    Each pass reads the diffs once and builds a new list, rather than splicing
+    the list in place, and passes repeat in a loop rather than by recursion,
+    so long diffs no longer cost quadratic time.  The result is the same as
+    the in-place version's.
+
+    Args:
+      diffs: Array of diff tuples.  Modified in place.
+    """
+    while True:
+      merged = self.diff_cleanupMergeEdits(diffs)
+      shifted, changes = self.diff_cleanupMergeShifts(merged)
+      diffs[:] = shifted
+      # If shifts were made, the diff needs reordering and another shift sweep.
+      if not changes:
+        return
+
+  def diff_cleanupMergeEdits(self, diffs):
+    """First pass of diff_cleanupMerge: merge each run of edits between two
+    equalities into at most one delete and one insert, factoring their common
+    prefix and suffix out into the equalities, and merge adjacent equalities.
+
     Args:
       diffs: Array of diff tuples.
+
+    Returns:
+      New array of diff tuples.
     """
-    diffs.append((self.DIFF_EQUAL, ''))  # Add a dummy entry at the end.
-    pointer = 0
+    merged = []
     count_delete = 0
     count_insert = 0
-    text_delete = ''
-    text_insert = ''
-    while pointer < len(diffs):
-      if diffs[pointer][0] == self.DIFF_INSERT:
+    texts_delete = []
+    texts_insert = []
+    # A dummy equality at the end closes the last run of edits.
+    for diff in diffs + [(self.DIFF_EQUAL, '')]:
+      if diff[0] == self.DIFF_INSERT:
         count_insert += 1
-        text_insert += diffs[pointer][1]
-        pointer += 1
-      elif diffs[pointer][0] == self.DIFF_DELETE:
+        texts_insert.append(diff[1])
+      elif diff[0] == self.DIFF_DELETE:
         count_delete += 1
-        text_delete += diffs[pointer][1]
-        pointer += 1
-      elif diffs[pointer][0] == self.DIFF_EQUAL:
+        texts_delete.append(diff[1])
+      elif diff[0] == self.DIFF_EQUAL:
         # Upon reaching an equality, check for prior redundancies.
         if count_delete + count_insert > 1:
+          text_delete = ''.join(texts_delete)
+          text_insert = ''.join(texts_insert)
           if count_delete != 0 and count_insert != 0:
             # Factor out any common prefixies.
             commonlength = self.diff_commonPrefix(text_insert, text_delete)
             if commonlength != 0:
-              x = pointer - count_delete - count_insert - 1
-              if x >= 0 and diffs[x][0] == self.DIFF_EQUAL:
-                diffs[x] = (diffs[x][0], diffs[x][1] +
-                            text_insert[:commonlength])
+              if merged and merged[-1][0] == self.DIFF_EQUAL:
+                merged[-1] = (merged[-1][0], merged[-1][1] +
+                              text_insert[:commonlength])
               else:
-                diffs.insert(0, (self.DIFF_EQUAL, text_insert[:commonlength]))
-                pointer += 1
+                # The edits are at the very start.
+                merged.append((self.DIFF_EQUAL, text_insert[:commonlength]))
               text_insert = text_insert[commonlength:]
               text_delete = text_delete[commonlength:]
             # Factor out any common suffixies.
             commonlength = self.diff_commonSuffix(text_insert, text_delete)
             if commonlength != 0:
-              diffs[pointer] = (diffs[pointer][0], text_insert[-commonlength:] +
-                  diffs[pointer][1])
+              diff = (diff[0], text_insert[-commonlength:] + diff[1])
               text_insert = text_insert[:-commonlength]
               text_delete = text_delete[:-commonlength]
-          # Delete the offending records and add the merged ones.
-          new_ops = []
+          # Replace the offending records with the merged ones.
           if len(text_delete) != 0:
-            new_ops.append((self.DIFF_DELETE, text_delete))
+            merged.append((self.DIFF_DELETE, text_delete))
           if len(text_insert) != 0:
-            new_ops.append((self.DIFF_INSERT, text_insert))
-          pointer -= count_delete + count_insert
-          diffs[pointer : pointer + count_delete + count_insert] = new_ops
-          pointer += len(new_ops) + 1
-        elif pointer != 0 and diffs[pointer - 1][0] == self.DIFF_EQUAL:
-          # Merge this equality with the previous one.
-          diffs[pointer - 1] = (diffs[pointer - 1][0],
-                                diffs[pointer - 1][1] + diffs[pointer][1])
-          del diffs[pointer]
+            merged.append((self.DIFF_INSERT, text_insert))
+          # Not merged with a previous equality even if no edits are left;
+          # the shift sweep and the next pass take care of that.
+          merged.append(diff)
         else:
-          pointer += 1
+          if count_delete != 0:
+            merged.append((self.DIFF_DELETE, texts_delete[0]))
+          elif count_insert != 0:
+            merged.append((self.DIFF_INSERT, texts_insert[0]))
+          if merged and merged[-1][0] == self.DIFF_EQUAL:
+            # Merge this equality with the previous one.
+            merged[-1] = (merged[-1][0], merged[-1][1] + diff[1])
+          else:
+            merged.append(diff)
 
         count_insert = 0
         count_delete = 0
-        text_delete = ''
-        text_insert = ''
+        texts_delete = []
+        texts_insert = []
 
-    if diffs[-1][1] == '':
-      diffs.pop()  # Remove the dummy entry at the end.
+    if merged[-1][1] == '':
+      merged.pop()  # Remove the dummy entry at the end.
+    return merged
 
-    # Second pass: look for single edits surrounded on both sides by equalities
-    # which can be shifted sideways to eliminate an equality.
-    # e.g: A<ins>BA</ins>C -> <ins>AB</ins>AC
-    changes = False
-    pointer = 1
+  def diff_cleanupMergeShifts(self, diffs):
+    """Second pass of diff_cleanupMerge: look for single edits surrounded on
+    both sides by equalities which can be shifted sideways to eliminate an
+    equality.  e.g: A<ins>BA</ins>C -> <ins>AB</ins>AC
+
+    Args:
+      diffs: Array of diff tuples.
+
+    Returns:
+      Tuple of the new array of diff tuples and whether any edit was shifted.
+    """
     # Intentionally ignore the first and last element (don't need checking).
-    while pointer < len(diffs) - 1:
-      if (diffs[pointer - 1][0] == self.DIFF_EQUAL and
-          diffs[pointer + 1][0] == self.DIFF_EQUAL):
+    if len(diffs) < 3:
+      return diffs, False
+    changes = False
+    shifted = [diffs[0]]
+    middle = diffs[1]
+    index = 2
+    while index < len(diffs):
+      previous = shifted[-1]
+      following = diffs[index]
+      index += 1
+      if (previous[0] == self.DIFF_EQUAL and
+          following[0] == self.DIFF_EQUAL):
         # This is a single edit surrounded by equalities.
-        if diffs[pointer][1].endswith(diffs[pointer - 1][1]):
+        if middle[1].endswith(previous[1]):
           # Shift the edit over the previous equality.
-          if diffs[pointer - 1][1] != "":
-            diffs[pointer] = (diffs[pointer][0],
-                diffs[pointer - 1][1] +
-                diffs[pointer][1][:-len(diffs[pointer - 1][1])])
-            diffs[pointer + 1] = (diffs[pointer + 1][0],
-                                  diffs[pointer - 1][1] + diffs[pointer + 1][1])
-          del diffs[pointer - 1]
+          shifted.pop()
+          if previous[1] != "":
+            middle = (middle[0],
+                      previous[1] + middle[1][:-len(previous[1])])
+            following = (following[0], previous[1] + following[1])
+          shifted.append(middle)
+          shifted.append(following)
           changes = True
-        elif diffs[pointer][1].startswith(diffs[pointer + 1][1]):
+          # The shifted equality is not an edit to check.
+          middle = diffs[index] if index < len(diffs) else None
+          index += 1
+          continue
+        elif middle[1].startswith(following[1]):
           # Shift the edit over the next equality.
-          diffs[pointer - 1] = (diffs[pointer - 1][0],
-                                diffs[pointer - 1][1] + diffs[pointer + 1][1])
-          diffs[pointer] = (diffs[pointer][0],
-              diffs[pointer][1][len(diffs[pointer + 1][1]):] +
-              diffs[pointer + 1][1])
-          del diffs[pointer + 1]
+          shifted[-1] = (previous[0], previous[1] + following[1])
+          shifted.append((middle[0],
+                          middle[1][len(following[1]):] + following[1]))
           changes = True
-      pointer += 1
-
-    # If shifts were made, the diff needs reordering and another shift sweep.
-    if changes:
-      self.diff_cleanupMerge(diffs)
+          middle = diffs[index] if index < len(diffs) else None
+          index += 1
+          continue
+      shifted.append(middle)
+      middle = following
+    if middle is not None:
+      shifted.append(middle)
+    return shifted, changes
 
   def diff_xIndex(self, diffs, loc):
     """loc is a location in text1, compute and return the equivalent location
@@ -0,0 +1,511 @@
+"""Myers diff over integer sequences.
+
+A port of diff_match_patch's diff_main/diff_bisect/diff_halfMatch/
+diff_cleanupMerge that works on sequences of word ids (lists, tuples,
+array('I'), memoryviews) instead of str. Word mode no longer has to pack ids
+into chr() code points, so there is no encode/decode round trip and no
+666666/1114111 vocabulary limit. Every step makes the same decisions as the
+str version, so for the same word ids the diff is the same one
+diff_linesToWords() + diff_main() + diff_charsToLines() would give.
+
+Diffs are lists of (op, tuple of ids). diff_text() turns them back into the
+usual (op, text) tuples and diff_ranges() into index ranges.
+"""
+
+import bisect
+import itertools
+import sys
+import time
+
+import diff_match_patch as dmp_module
+
+
+DIFF_DELETE = dmp_module.diff_match_patch.DIFF_DELETE
+DIFF_INSERT = dmp_module.diff_match_patch.DIFF_INSERT
+DIFF_EQUAL = dmp_module.diff_match_patch.DIFF_EQUAL
+
+
+def find(sequence, sub, start=0):
+    # str.find() for tuples
+    if not sub:
+        return start if start <= len(sequence) else -1
+    first = sub[0]
+    length = len(sub)
+    last = len(sequence) - length
+    index = start
+    while index <= last:
+        try:
+            index = sequence.index(first, index, last + 1)
+        except ValueError:
+            return -1
+        if sequence[index:index + length] == sub:
+            return index
+        index += 1
+    return -1
+
+
+def common_prefix(seq1, seq2):
+    length = min(len(seq1), len(seq2))
+    index = 0
+    while index < length and seq1[index] == seq2[index]:
+        index += 1
+    return index
+
+
+def common_suffix(seq1, seq2):
+    length = min(len(seq1), len(seq2))
+    index = 0
+    while index < length and seq1[-index - 1] == seq2[-index - 1]:
+        index += 1
+    return index
+
+
+def common_prefix_at(seq1, start1, seq2, start2):
+    # common_prefix(seq1[start1:], seq2[start2:]) without copying either sequence
+    length = min(len(seq1) - start1, len(seq2) - start2)
+    index = 0
+    while index < length and seq1[start1 + index] == seq2[start2 + index]:
+        index += 1
+    return index
+
+
+def common_suffix_at(seq1, end1, seq2, end2):
+    # common_suffix(seq1[:end1], seq2[:end2]) without copying either sequence
+    length = min(end1, end2)
+    index = 0
+    while index < length and seq1[end1 - index - 1] == seq2[end2 - index - 1]:
+        index += 1
+    return index
+
+
+def unique_anchors(seq1, seq2):
+    # (index in seq1, index in seq2) of the longest run of ids that occur exactly once in each sequence, in
+    # increasing order in both. see diff_match_patch.diff_uniqueAnchors
+    index1 = {}
+    for i, word_id in enumerate(seq1):
+        index1[word_id] = -1 if word_id in index1 else i
+    index2 = {}
+    for j, word_id in enumerate(seq2):
+        index2[word_id] = -1 if word_id in index2 else j
+    candidates = sorted((i, index2[word_id]) for word_id, i in index1.items()
+                        if i != -1 and index2.get(word_id, -1) != -1)
+
+    # longest increasing subsequence of the seq2 indexes (patience sort)
+    tails = []
+    tail_candidates = []
+    previous = [None] * len(candidates)
+    for n, (i, j) in enumerate(candidates):
+        k = bisect.bisect_left(tails, j)
+        if k == len(tails):
+            tails.append(j)
+            tail_candidates.append(n)
+        else:
+            tails[k] = j
+            tail_candidates[k] = n
+        if k:
+            previous[n] = tail_candidates[k - 1]
+    anchors = []
+    n = tail_candidates[-1] if tail_candidates else None
+    while n is not None:
+        anchors.append(candidates[n])
+        n = previous[n]
+    anchors.reverse()
+    return anchors
+
+
+def ends_with(sequence, suffix):
+    return sequence[len(sequence) - len(suffix):] == suffix
+
+
+class SequenceDiff:
+    def __init__(self):
+        # same meaning as diff_match_patch.Diff_Timeout; halfMatch is only used when it is > 0
+        self.Diff_Timeout = 1.0
+        # same meaning as diff_match_patch.Diff_Budget: if > 0, a count of diagonals diff_bisect may explore
+        # replaces the wall clock deadline
+        self.Diff_Budget = 0
+        self.Diff_BudgetLeft = 0
+        self.Diff_BudgetExhausted = False
+        # same meaning as diff_match_patch.Diff_BisectCalls and Diff_HalfMatches
+        self.Diff_BisectCalls = 0
+        self.Diff_HalfMatches = 0
+        # same meaning as diff_match_patch.Diff_AnchorLength: sequences longer than this together are split at
+        # their common unique ids before diff_bisect
+        self.Diff_AnchorLength = 0
+
+    def diff_main(self, seq1, seq2, deadline=None):
+        # diff_match_patch.diff_main() with checklines=False
+        if deadline is None:
+            self.Diff_BisectCalls = 0
+            self.Diff_HalfMatches = 0
+            if self.Diff_Budget > 0:
+                self.Diff_BudgetLeft = self.Diff_Budget
+                self.Diff_BudgetExhausted = False
+                deadline = sys.maxsize
+            else:
+                deadline = sys.maxsize if self.Diff_Timeout <= 0 else time.time() + self.Diff_Timeout
+        seq1 = tuple(seq1)
+        seq2 = tuple(seq2)
+
+        if seq1 == seq2:
+            if seq1:
+                return [(DIFF_EQUAL, seq1)]
+            return []
+
+        # trim off common prefix and suffix
+        length = common_prefix(seq1, seq2)
+        prefix = seq1[:length]
+        seq1 = seq1[length:]
+        seq2 = seq2[length:]
+        length = common_suffix(seq1, seq2)
+        if length == 0:
+            suffix = ()
+        else:
+            suffix = seq1[-length:]
+            seq1 = seq1[:-length]
+            seq2 = seq2[:-length]
+
+        diffs = self.diff_compute(seq1, seq2, deadline)
+
+        if prefix:
+            diffs[:0] = [(DIFF_EQUAL, prefix)]
+        if suffix:
+            diffs.append((DIFF_EQUAL, suffix))
+        self.diff_cleanupMerge(diffs)
+        return diffs
+
+    def diff_compute(self, seq1, seq2, deadline):
+        if not seq1:
+            return [(DIFF_INSERT, seq2)]
+        if not seq2:
+            return [(DIFF_DELETE, seq1)]
+
+        if len(seq1) > len(seq2):
+            (longseq, shortseq) = (seq1, seq2)
+        else:
+            (shortseq, longseq) = (seq1, seq2)
+        index = find(longseq, shortseq)
+        if index != -1:
+            # shorter sequence is inside the longer one
+            diffs = [(DIFF_INSERT, longseq[:index]), (DIFF_EQUAL, shortseq),
+                     (DIFF_INSERT, longseq[index + len(shortseq):])]
+            if len(seq1) > len(seq2):
+                diffs[0] = (DIFF_DELETE, diffs[0][1])
+                diffs[2] = (DIFF_DELETE, diffs[2][1])
+            return diffs
+
+        if len(shortseq) == 1:
+            # after the previous check, the single id can't be an equality
+            return [(DIFF_DELETE, seq1), (DIFF_INSERT, seq2)]
+
+        half_match = self.diff_halfMatch(seq1, seq2)
+        if half_match:
+            self.Diff_HalfMatches += 1
+            (seq1_a, seq1_b, seq2_a, seq2_b, mid_common) = half_match
+            diffs_a = self.diff_main(seq1_a, seq2_a, deadline)
+            diffs_b = self.diff_main(seq1_b, seq2_b, deadline)
+            return diffs_a + [(DIFF_EQUAL, mid_common)] + diffs_b
+
+        if 0 < self.Diff_AnchorLength < len(seq1) + len(seq2):
+            diffs = self.diff_anchorSplit(seq1, seq2, deadline)
+            if diffs is not None:
+                return diffs
+
+        self.Diff_BisectCalls += 1
+        return self.diff_bisect(seq1, seq2, deadline)
+
+    def diff_anchorSplit(self, seq1, seq2, deadline):
+        # diff the stretches between unique_anchors() separately, or None if there are none.
+        # see diff_match_patch.diff_anchorSplit
+        anchors = unique_anchors(seq1, seq2)
+        if not anchors:
+            return None
+        diffs = []
+        x = 0
+        y = 0
+        for i, j in anchors:
+            diffs += self.diff_main(seq1[x:i], seq2[y:j], deadline)
+            diffs.append((DIFF_EQUAL, seq1[i:i + 1]))
+            x = i + 1
+            y = j + 1
+        diffs += self.diff_main(seq1[x:], seq2[y:], deadline)
+        return diffs
+
+    def diff_bisect(self, seq1, seq2, deadline):
+        # find the middle snake, split the problem in two and recurse. see diff_match_patch.diff_bisect
+        seq1_length = len(seq1)
+        seq2_length = len(seq2)
+        max_d = (seq1_length + seq2_length + 1) // 2
+        v_offset = max_d
+        v_length = 2 * max_d
+        v1 = [-1] * v_length
+        v1[v_offset + 1] = 0
+        v2 = v1[:]
+        delta = seq1_length - seq2_length
+        # if the total length is odd, the front path will collide with the reverse path
+        front = (delta % 2 != 0)
+        k1start = 0
+        k1end = 0
+        k2start = 0
+        k2end = 0
+        for d in range(max_d):
+            if self.diff_deadlineReached(deadline, d):
+                break
+
+            # walk the front path one step
+            for k1 in range(-d + k1start, d + 1 - k1end, 2):
+                k1_offset = v_offset + k1
+                if k1 == -d or (k1 != d and v1[k1_offset - 1] < v1[k1_offset + 1]):
+                    x1 = v1[k1_offset + 1]
+                else:
+                    x1 = v1[k1_offset - 1] + 1
+                y1 = x1 - k1
+                while x1 < seq1_length and y1 < seq2_length and seq1[x1] == seq2[y1]:
+                    x1 += 1
+                    y1 += 1
+                v1[k1_offset] = x1
+                if x1 > seq1_length:
+                    k1end += 2
+                elif y1 > seq2_length:
+                    k1start += 2
+                elif front:
+                    k2_offset = v_offset + delta - k1
+                    if 0 <= k2_offset < v_length and v2[k2_offset] != -1:
+                        x2 = seq1_length - v2[k2_offset]
+                        if x1 >= x2:
+                            return self.diff_bisectSplit(seq1, seq2, x1, y1, deadline)
+
+            # walk the reverse path one step
+            for k2 in range(-d + k2start, d + 1 - k2end, 2):
+                k2_offset = v_offset + k2
+                if k2 == -d or (k2 != d and v2[k2_offset - 1] < v2[k2_offset + 1]):
+                    x2 = v2[k2_offset + 1]
+                else:
+                    x2 = v2[k2_offset - 1] + 1
+                y2 = x2 - k2
+                while x2 < seq1_length and y2 < seq2_length and seq1[-x2 - 1] == seq2[-y2 - 1]:
+                    x2 += 1
+                    y2 += 1
+                v2[k2_offset] = x2
+                if x2 > seq1_length:
+                    k2end += 2
+                elif y2 > seq2_length:
+                    k2start += 2
+                elif not front:
+                    k1_offset = v_offset + delta - k2
+                    if 0 <= k1_offset < v_length and v1[k1_offset] != -1:
+                        x1 = v1[k1_offset]
+                        y1 = v_offset + x1 - k1_offset
+                        x2 = seq1_length - x2
+                        if x1 >= x2:
+                            return self.diff_bisectSplit(seq1, seq2, x1, y1, deadline)
+
+        # hit the deadline, or nothing in common at all
+        return [(DIFF_DELETE, seq1), (DIFF_INSERT, seq2)]
+
+    def diff_deadlineReached(self, deadline, d):
+        # see diff_match_patch.diff_deadlineReached
+        if self.Diff_Budget > 0:
+            self.Diff_BudgetLeft -= 2 * d + 2
+            if self.Diff_BudgetLeft < 0:
+                self.Diff_BudgetExhausted = True
+                return True
+            return False
+        return time.time() > deadline
+
+    def diff_bisectSplit(self, seq1, seq2, x, y, deadline):
+        diffs = self.diff_main(seq1[:x], seq2[:y], deadline)
+        diffsb = self.diff_main(seq1[x:], seq2[y:], deadline)
+        return diffs + diffsb
+
+    def diff_halfMatch(self, seq1, seq2):
+        # do the sequences share a run at least half the length of the longer one? see diff_match_patch.diff_halfMatch
+        if self.Diff_Timeout <= 0:
+            # don't risk a non-optimal diff if we have unlimited time
+            return None
+        if len(seq1) > len(seq2):
+            (longseq, shortseq) = (seq1, seq2)
+        else:
+            (shortseq, longseq) = (seq1, seq2)
+        if len(longseq) < 4 or len(shortseq) * 2 < len(longseq):
+            return None
+
+        def diff_halfMatchI(longseq, shortseq, i):
+            seed = longseq[i:i + len(longseq) // 4]
+            best_common = ()
+            j = find(shortseq, seed)
+            while j != -1:
+                # index-based, so each candidate costs its match length rather than a copy of both sequences
+                prefix_length = common_prefix_at(longseq, i, shortseq, j)
+                suffix_length = common_suffix_at(longseq, i, shortseq, j)
+                if len(best_common) < suffix_length + prefix_length:
+                    best_common = shortseq[j - suffix_length:j] + shortseq[j:j + prefix_length]
+                    best_longseq_a = longseq[:i - suffix_length]
+                    best_longseq_b = longseq[i + prefix_length:]
+                    best_shortseq_a = shortseq[:j - suffix_length]
+                    best_shortseq_b = shortseq[j + prefix_length:]
+                j = find(shortseq, seed, j + 1)
+
+            if len(best_common) * 2 >= len(longseq):
+                return (best_longseq_a, best_longseq_b, best_shortseq_a, best_shortseq_b, best_common)
+            return None
+
+        # seed from the second quarter, then the third
+        hm1 = diff_halfMatchI(longseq, shortseq, (len(longseq) + 3) // 4)
+        hm2 = diff_halfMatchI(longseq, shortseq, (len(longseq) + 1) // 2)
+        if not hm1 and not hm2:
+            return None
+        elif not hm2:
+            hm = hm1
+        elif not hm1:
+            hm = hm2
+        else:
+            hm = hm1 if len(hm1[4]) > len(hm2[4]) else hm2
+
+        if len(seq1) > len(seq2):
+            (seq1_a, seq1_b, seq2_a, seq2_b, mid_common) = hm
+        else:
+            (seq2_a, seq2_b, seq1_a, seq1_b, mid_common) = hm
+        return (seq1_a, seq1_b, seq2_a, seq2_b, mid_common)
+
+    def diff_cleanupMerge(self, diffs):
+        # reorder and merge like edit sections, merge equalities. see diff_match_patch.diff_cleanupMerge;
+        # each pass builds a new list and passes repeat in a loop, so it is linear per pass
+        while True:
+            merged = self.diff_cleanupMergeEdits(diffs)
+            shifted, changes = self.diff_cleanupMergeShifts(merged)
+            diffs[:] = shifted
+            if not changes:
+                return
+
+    def diff_cleanupMergeEdits(self, diffs):
+        # first pass: merge each run of edits into at most one delete and one insert, factoring their
+        # common prefix and suffix out into the surrounding equalities, and merge adjacent equalities
+        merged = []
+        count_delete = 0
+        count_insert = 0
+        seqs_delete = []
+        seqs_insert = []
+        # a dummy equality at the end closes the last run of edits
+        for diff in itertools.chain(diffs, [(DIFF_EQUAL, ())]):
+            if diff[0] == DIFF_INSERT:
+                count_insert += 1
+                seqs_insert.append(diff[1])
+            elif diff[0] == DIFF_DELETE:
+                count_delete += 1
+                seqs_delete.append(diff[1])
+            elif diff[0] == DIFF_EQUAL:
+                if count_delete + count_insert > 1:
+                    seq_delete = tuple(itertools.chain.from_iterable(seqs_delete))
+                    seq_insert = tuple(itertools.chain.from_iterable(seqs_insert))
+                    if count_delete != 0 and count_insert != 0:
+                        # factor out any common prefix
+                        length = common_prefix(seq_insert, seq_delete)
+                        if length != 0:
+                            if merged and merged[-1][0] == DIFF_EQUAL:
+                                merged[-1] = (merged[-1][0], merged[-1][1] + seq_insert[:length])
+                            else:
+                                # the edits are at the very start
+                                merged.append((DIFF_EQUAL, seq_insert[:length]))
+                            seq_insert = seq_insert[length:]
+                            seq_delete = seq_delete[length:]
+                        # factor out any common suffix
+                        length = common_suffix(seq_insert, seq_delete)
+                        if length != 0:
+                            diff = (diff[0], seq_insert[-length:] + diff[1])
+                            seq_insert = seq_insert[:-length]
+                            seq_delete = seq_delete[:-length]
+                    if len(seq_delete) != 0:
+                        merged.append((DIFF_DELETE, seq_delete))
+                    if len(seq_insert) != 0:
+                        merged.append((DIFF_INSERT, seq_insert))
+                    # not merged with a previous equality even if no edits are left, same as the str version
+                    merged.append(diff)
+                else:
+                    if count_delete != 0:
+                        merged.append((DIFF_DELETE, seqs_delete[0]))
+                    elif count_insert != 0:
+                        merged.append((DIFF_INSERT, seqs_insert[0]))
+                    if merged and merged[-1][0] == DIFF_EQUAL:
+                        # merge this equality with the previous one
+                        merged[-1] = (merged[-1][0], merged[-1][1] + diff[1])
+                    else:
+                        merged.append(diff)
+
+                count_insert = 0
+                count_delete = 0
+                seqs_delete = []
+                seqs_insert = []
+
+        if merged[-1][1] == ():
+            merged.pop()
+        return merged
+
+    def diff_cleanupMergeShifts(self, diffs):
+        # second pass: shift single edits surrounded by equalities sideways to eliminate an equality,
+        # e.g. A<ins>BA</ins>C -> <ins>AB</ins>AC. returns (new diffs, whether anything was shifted)
+        if len(diffs) < 3:
+            return diffs, False
+        changes = False
+        shifted = [diffs[0]]
+        middle = diffs[1]
+        index = 2
+        while index < len(diffs):
+            previous = shifted[-1]
+            following = diffs[index]
+            index += 1
+            if previous[0] == DIFF_EQUAL and following[0] == DIFF_EQUAL:
+                edit = middle[1]
+                if ends_with(edit, previous[1]):
+                    # shift the edit over the previous equality
+                    shifted.pop()
+                    if previous[1]:
+                        middle = (middle[0], previous[1] + edit[:-len(previous[1])])
+                        following = (following[0], previous[1] + following[1])
+                    shifted.append(middle)
+                    shifted.append(following)
+                    changes = True
+                    # the shifted equality is not an edit to check
+                    middle = diffs[index] if index < len(diffs) else None
+                    index += 1
+                    continue
+                elif edit[:len(following[1])] == following[1]:
+                    # shift the edit over the next equality
+                    shifted[-1] = (previous[0], previous[1] + following[1])
+                    shifted.append((middle[0], edit[len(following[1]):] + following[1]))
+                    changes = True
+                    middle = diffs[index] if index < len(diffs) else None
+                    index += 1
+                    continue
+            shifted.append(middle)
+            middle = following
+        if middle is not None:
+            shifted.append(middle)
+        return shifted, changes
+
+
+def diff_sequences(seq1, seq2, timeout=1.0, budget=0):
+    # [(op, tuple of ids)] turning seq1 into seq2
+    differ = SequenceDiff()
+    differ.Diff_Timeout = timeout
+    differ.Diff_Budget = budget
+    return differ.diff_main(seq1, seq2)
+
+
+def diff_text(diffs, words):
+    # (op, text) tuples, as diff_charsToLines() would produce, given words[id] for every id
+    return [(op, "".join([words[word_id] for word_id in ids])) for op, ids in diffs]
+
+
+def diff_ranges(diffs):
+    # (op, start1, end1, start2, end2) index ranges into the two input sequences
+    ranges = []
+    position1 = 0
+    position2 = 0
+    for op, ids in diffs:
+        end1 = position1 if op == DIFF_INSERT else position1 + len(ids)
+        end2 = position2 if op == DIFF_DELETE else position2 + len(ids)
+        ranges.append((op, position1, end1, position2, end2))
+        position1 = end1
+        position2 = end2
+    return ranges
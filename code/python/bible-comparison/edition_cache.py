@@ -0,0 +1,257 @@
+"""Persistent binary cache of parsed and normalized editions.
+
+An edition is stored as flat arrays: integer verse ids, per-verse start offsets
+into a token id array, a 64-bit digest of each verse's normalized text, and a
+vocabulary of distinct words with their normalized forms. A warm load reads
+those arrays back without touching BCVID, the word regex or
+greek_normalisation. The cache file is keyed by the sha256 of the
+source TSV and the normalization settings; if either changes it is rebuilt.
+"""
+
+import array
+import dataclasses
+import hashlib
+import json
+import os
+import struct
+import sys
+import time
+from importlib import metadata
+
+import comparison_core
+
+
+CACHE_VERSION = 2
+MAGIC = b"BCEDTN\x00\x01"
+# sections are padded to this so they can be cast straight out of a buffer or mmap
+SECTION_ALIGN = 8
+
+
+def normalization_settings():
+    # anything that changes the loaded or normalized text has to invalidate the cache
+    try:
+        greek_normalisation_version = metadata.version("greek-normalisation")
+    except metadata.PackageNotFoundError:
+        greek_normalisation_version = "unknown"
+    return {"word_pattern": comparison_core.WORD_PATTERN,
+            "normalize_word": ["strip_accents", "lower", "nfkc"],
+            "greek-normalisation": greek_normalisation_version}
+
+
+def file_hash(path):
+    digest = hashlib.sha256()
+    with open(path, 'rb') as infile:
+        for block in iter(lambda: infile.read(1 << 20), b''):
+            digest.update(block)
+    return digest.hexdigest()
+
+
+def pack_strings(strings):
+    return "\n".join(strings).encode('utf-8')
+
+
+def unpack_strings(data, count):
+    if count == 0:
+        return []
+    return bytes(data).decode('utf-8').split("\n")
+
+
+def pack_sections(header, sections):
+    # layout: MAGIC | uint64 header length | JSON header | padded sections.
+    # section offsets in the header are relative to the end of the padded header.
+    section_table = {}
+    offset = 0
+    for name, data in sections.items():
+        typecode = data.typecode if isinstance(data, array.array) else None
+        length = len(data) * data.itemsize if isinstance(data, array.array) else len(data)
+        section_table[name] = [offset, length, typecode]
+        offset += length + (-length % SECTION_ALIGN)
+    header = dict(header, byteorder=sys.byteorder, sections=section_table)
+    header_bytes = json.dumps(header, ensure_ascii=False).encode('utf-8')
+    header_bytes += b" " * (-(len(MAGIC) + 8 + len(header_bytes)) % SECTION_ALIGN)
+
+    packed = bytearray(MAGIC)
+    packed += struct.pack("<Q", len(header_bytes))
+    packed += header_bytes
+    for data in sections.values():
+        packed += data.tobytes() if isinstance(data, array.array) else data
+        packed += b"\x00" * (-len(packed) % SECTION_ALIGN)
+    return packed
+
+
+def write_sections(path, header, sections):
+    # write to a temp file and swap it in, so a crashed run never leaves a half-written cache
+    os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+    temp_path = f"{path}.{os.getpid()}.tmp"
+    with open(temp_path, 'wb') as outfile:
+        outfile.write(pack_sections(header, sections))
+    os.replace(temp_path, path)
+
+
+def read_header(buffer):
+    # returns (header, offset of the first section), or (None, 0) if this isn't a cache file we can use
+    if len(buffer) < len(MAGIC) + 8 or bytes(buffer[:len(MAGIC)]) != MAGIC:
+        return None, 0
+    (header_length,) = struct.unpack_from("<Q", buffer, len(MAGIC))
+    data_start = len(MAGIC) + 8 + header_length
+    header = json.loads(bytes(buffer[len(MAGIC) + 8:data_start]).decode('utf-8'))
+    if not isinstance(header, dict) or header.get("byteorder") != sys.byteorder:
+        return None, 0
+    return header, data_start
+
+
+def read_section(buffer, header, data_start, name):
+    # zero-copy view of one section; typed sections are cast to their array typecode.
+    # raises ValueError if the section runs past the end of a truncated file
+    offset, length, typecode = header["sections"][name]
+    if data_start + offset + length > len(buffer):
+        raise ValueError(f"section {name} runs past the end of the file")
+    view = memoryview(buffer)[data_start + offset:data_start + offset + length]
+    return view.cast(typecode) if typecode else view
+
+
+@dataclasses.dataclass
+class CachedVerse:
+    identifier: str
+    usfm: str
+    # comparison_core.text_digest() of the normalized verse text
+    digest: int
+    edition: "EncodedEdition"
+    index: int
+
+    @property
+    def text(self):
+        # normalized verse text, as get_verse_text() would return it. only built when asked for.
+        return self.edition.verse_text(self.index)
+
+
+def cached_verse_text(verse):
+    return verse.text
+
+
+@dataclasses.dataclass
+class EncodedEdition:
+    edition: str
+    # integer BCV ids (40001001) in file order
+    verse_ids: array.array
+    usfm: list[str]
+    # verse i is token_ids[verse_starts[i]:verse_starts[i + 1]]
+    verse_starts: array.array
+    # index into vocabulary for every word in the edition
+    token_ids: array.array
+    # comparison_core.text_digest() of each verse's normalized text, so equal verses can be found without it
+    digests: array.array
+    # distinct words as loaded (WORD_PATTERN removed) and their normalize_word() forms
+    vocabulary: list[str]
+    normalized: list[str]
+
+    def __len__(self):
+        return len(self.verse_ids)
+
+    def verse_text(self, index):
+        normalized = self.normalized
+        tokens = self.token_ids[self.verse_starts[index]:self.verse_starts[index + 1]]
+        return " ".join([normalized[token_id] for token_id in tokens]).rstrip()
+
+    def verses(self):
+        for index, verse_id in enumerate(self.verse_ids):
+            yield CachedVerse(f"{verse_id:08d}", self.usfm[index], self.digests[index], self, index)
+
+
+def encode_edition(edition, edition_file_name):
+    verse_ids = array.array('I')
+    usfm = []
+    verse_starts = array.array('I', [0])
+    token_ids = array.array('I')
+    vocabulary = []
+    word_ids = {}
+    for verse in comparison_core.iter_verses(edition, edition_file_name):
+        verse_ids.append(int(verse.identifier))
+        usfm.append(verse.usfm)
+        for word in verse.words.values():
+            token_id = word_ids.get(word.text)
+            if token_id is None:
+                token_id = word_ids[word.text] = len(vocabulary)
+                vocabulary.append(word.text)
+            token_ids.append(token_id)
+        verse_starts.append(len(token_ids))
+    # normalize each distinct word once rather than every occurrence
+    normalized = [comparison_core.normalize_word(word) for word in vocabulary]
+    encoded = EncodedEdition(edition, verse_ids, usfm, verse_starts, token_ids, array.array('Q'), vocabulary,
+                             normalized)
+    encoded.digests.extend(comparison_core.text_digest(encoded.verse_text(index)) for index in range(len(encoded)))
+    return encoded
+
+
+def save_edition(encoded, path, source_hash):
+    header = {"version": CACHE_VERSION, "edition": encoded.edition, "source_hash": source_hash,
+              "normalization": normalization_settings(), "verse_count": len(encoded.verse_ids),
+              "vocabulary_count": len(encoded.vocabulary)}
+    write_sections(path, header, {
+        "verse_ids": encoded.verse_ids,
+        "verse_starts": encoded.verse_starts,
+        "token_ids": encoded.token_ids,
+        "digests": encoded.digests,
+        "usfm": pack_strings(encoded.usfm),
+        "vocabulary": pack_strings(encoded.vocabulary),
+        "normalized": pack_strings(encoded.normalized),
+    })
+
+
+def read_edition(path, source_hash):
+    # returns None when there is no usable cache for this source file and normalization, or the file is damaged
+    try:
+        with open(path, 'rb') as infile:
+            buffer = infile.read()
+    except FileNotFoundError:
+        return None
+    try:
+        return decode_edition(buffer, source_hash)
+    except (ValueError, KeyError, TypeError):
+        # truncated sections, a bad header (json.JSONDecodeError and UnicodeDecodeError are ValueErrors),
+        # missing sections or counts that don't match
+        return None
+
+
+def decode_edition(buffer, source_hash):
+    header, data_start = read_header(buffer)
+    if (header is None or header.get("version") != CACHE_VERSION or header.get("source_hash") != source_hash
+            or header.get("normalization") != normalization_settings()):
+        return None
+
+    def section(name):
+        return read_section(buffer, header, data_start, name)
+
+    verse_count = header["verse_count"]
+    vocabulary_count = header["vocabulary_count"]
+    encoded = EncodedEdition(header["edition"],
+                             array.array('I', section("verse_ids")),
+                             unpack_strings(section("usfm"), verse_count),
+                             array.array('I', section("verse_starts")),
+                             array.array('I', section("token_ids")),
+                             array.array('Q', section("digests")),
+                             unpack_strings(section("vocabulary"), vocabulary_count),
+                             unpack_strings(section("normalized"), vocabulary_count))
+    # a file that was damaged rather than cut short fails here, instead of with an IndexError mid-report
+    if (len(encoded.verse_ids) != verse_count or len(encoded.usfm) != verse_count
+            or len(encoded.digests) != verse_count or len(encoded.verse_starts) != verse_count + 1
+            or encoded.verse_starts[-1] != len(encoded.token_ids)
+            or len(encoded.vocabulary) != vocabulary_count or len(encoded.normalized) != vocabulary_count
+            or (encoded.token_ids and max(encoded.token_ids) >= vocabulary_count)):
+        raise ValueError("section lengths don't match the header")
+    return encoded
+
+
+def load_edition(edition, edition_file_name, cache_dir):
+    # load from cache_dir if the cached copy matches the source file, otherwise parse and cache it
+    start = time.perf_counter()
+    source_hash = file_hash(comparison_core.edition_path(edition_file_name))
+    cache_path = os.path.join(cache_dir, f"{edition}.edition")
+    encoded = read_edition(cache_path, source_hash)
+    state = "warm"
+    if encoded is None:
+        state = "cold"
+        encoded = encode_edition(edition, edition_file_name)
+        save_edition(encoded, cache_path, source_hash)
+    print(f"Loaded {edition} in {time.perf_counter() - start:.3f}s ({state} cache)")
+    return encoded
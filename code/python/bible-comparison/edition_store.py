@@ -0,0 +1,175 @@
+"""Memory-mapped columnar edition store.
+
+An edition is written once as five columns: a UTF-8 blob of every word in
+order, byte offsets of each word in that blob, the index of each verse's first
+word, the integer verse ids, and a digest of each verse's normalized text.
+EditionStore maps the file read-only, so any number of processes opening the
+same file share one copy of it in the page cache. Nothing is decoded until a
+verse is asked for, and then only that verse.
+"""
+
+import array
+import bisect
+import mmap
+import os
+
+from biblelib.word import BCVID
+
+import comparison_core
+import edition_cache
+
+
+STORE_VERSION = 2
+
+
+def build_store(edition, edition_file_name, path):
+    tokens = bytearray()
+    token_offsets = array.array('I', [0])
+    verse_starts = array.array('I', [0])
+    verse_ids = array.array('I')
+    digests = array.array('Q')
+    for verse in comparison_core.iter_verses(edition, edition_file_name):
+        verse_ids.append(int(verse.identifier))
+        digests.append(comparison_core.text_digest(comparison_core.get_verse_text(verse)))
+        for word in verse.words.values():
+            tokens += word.text.encode('utf-8')
+            token_offsets.append(len(tokens))
+        verse_starts.append(len(token_offsets) - 1)
+    header = {"store_version": STORE_VERSION, "edition": edition,
+              "source_hash": edition_cache.file_hash(comparison_core.edition_path(edition_file_name)),
+              "normalization": edition_cache.normalization_settings()}
+    edition_cache.write_sections(path, header, {
+        "verse_ids": verse_ids,
+        "verse_starts": verse_starts,
+        "token_offsets": token_offsets,
+        "tokens": bytes(tokens),
+        "digests": digests,
+    })
+
+
+def open_store(edition, edition_file_name, store_dir):
+    # open the store for an edition, (re)building it first if it is missing or stale
+    path = os.path.join(store_dir, f"{edition}.store")
+    source_hash = edition_cache.file_hash(comparison_core.edition_path(edition_file_name))
+    if os.path.exists(path):
+        try:
+            store = EditionStore(path)
+        except ValueError as error:
+            # empty, truncated or otherwise unreadable, e.g. written on a machine with the other byte order
+            print(f"Rebuilding {path}: {error}")
+        else:
+            if (store.header.get("store_version") == STORE_VERSION and store.header.get("source_hash") == source_hash
+                    and store.header.get("normalization") == edition_cache.normalization_settings()):
+                return store
+            store.close()
+    build_store(edition, edition_file_name, path)
+    return EditionStore(path)
+
+
+class VerseView:
+    # a Verse-compatible view of one verse in an EditionStore. words and usfm are only built when first read.
+    __slots__ = ("store", "index", "identifier", "_usfm", "_words")
+
+    def __init__(self, store, index):
+        self.store = store
+        self.index = index
+        self.identifier = f"{store.verse_ids[index]:08d}"
+        self._usfm = None
+        self._words = None
+
+    @property
+    def book(self):
+        return self.identifier[:2]
+
+    @property
+    def chapter(self):
+        return self.identifier[2:5]
+
+    @property
+    def verse(self):
+        return self.identifier[5:]
+
+    @property
+    def digest(self):
+        return self.store.digests[self.index]
+
+    @property
+    def usfm(self):
+        if self._usfm is None:
+            self._usfm = BCVID(self.identifier).to_usfm()
+        return self._usfm
+
+    @property
+    def words(self):
+        if self._words is None:
+            self._words = {}
+            for word_in_verse, text in enumerate(self.store.verse_words(self.index), start=1):
+                word_id = self.identifier + str(word_in_verse).zfill(3)
+                self._words[word_id] = comparison_core.Word(word_id, text)
+        return self._words
+
+
+class EditionStore:
+    def __init__(self, path):
+        self.path = path
+        self.views = []
+        with open(path, 'rb') as infile:
+            # mmap raises ValueError for an empty file
+            self.mapping = mmap.mmap(infile.fileno(), 0, access=mmap.ACCESS_READ)
+
+        def section(name):
+            view = edition_cache.read_section(self.mapping, self.header, data_start, name)
+            self.views.append(view)
+            return view
+
+        try:
+            self.header, data_start = edition_cache.read_header(self.mapping)
+            if self.header is None:
+                raise ValueError("no edition store header, or one written with the other byte order")
+            self.verse_ids = section("verse_ids")
+            self.verse_starts = section("verse_starts")
+            self.token_offsets = section("token_offsets")
+            self.tokens = section("tokens")
+            self.digests = section("digests")
+        except (ValueError, KeyError, TypeError) as error:
+            # a bad header (ValueError covers bad JSON and UTF-8), a missing section or a section whose length
+            # doesn't fit its typecode
+            self.close()
+            raise ValueError(f"{path} is not a usable edition store: {error}") from error
+
+    def __len__(self):
+        return len(self.verse_ids)
+
+    def __getitem__(self, index):
+        return VerseView(self, index)
+
+    def __iter__(self):
+        for index in range(len(self.verse_ids)):
+            yield VerseView(self, index)
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def find(self, verse_id):
+        # index of a verse by its id (str or int), or -1. stores are written in BCV order.
+        verse_id = int(verse_id)
+        index = bisect.bisect_left(self.verse_ids, verse_id)
+        if index < len(self.verse_ids) and self.verse_ids[index] == verse_id:
+            return index
+        return -1
+
+    def verse_words(self, index):
+        offsets = self.token_offsets
+        tokens = self.tokens
+        return [str(tokens[offsets[position]:offsets[position + 1]], 'utf-8')
+                for position in range(self.verse_starts[index], self.verse_starts[index + 1])]
+
+    def close(self):
+        # views into the mapping have to be released before it can be closed
+        for view in self.views:
+            view.release()
+        self.views = []
+        self.mapping.close()
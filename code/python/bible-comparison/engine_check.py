@@ -0,0 +1,144 @@
+"""Check the diff engines against each other and time them at verse lengths.
+
+Random word-id sequence pairs (small alphabets, so ties between equally good
+alignments are common, and edits from a few words up to the whole length)
+are diffed by diff_match_patch on chr()-encoded words and by diff_sequence,
+with Diff_Timeout 0 (pure Myers) and with halfMatch on (a timeout that is
+never reached, so runs are repeatable). The two must give the same diff for
+every pair. Then N1904 and SBLGNT are compared verse by verse with each
+--engine, and with --span chapter and book. Every run must find the same
+number of matches, differences and verses only one edition has, and dmp and
+sequence the same diff for every verse. Last, both engines are timed on
+random pairs of verse to chapter lengths.
+
+    python engine_check.py [random pairs per setting]
+
+Exits with status 1 if any check fails.
+"""
+
+import collections
+import functools
+import random
+import sys
+import time
+
+import comparison_session
+import diff_match_patch as dmp_module
+import diff_sequence
+import span_compare
+
+
+# (Diff_Timeout, name): 0 is pure Myers; a timeout no diff here reaches turns halfMatch on and stays repeatable
+TIMEOUTS = ((0, "timeout 0"), (3600, "halfMatch"))
+# (combined length, fraction of words edited) of the timed pairs
+BENCH_SIZES = ((30, 0.15), (60, 0.35), (120, 0.5), (250, 0.5), (500, 0.5))
+BENCH_PAIRS = 200
+
+
+def mutate(rng, sequence, alphabet, edits):
+    # sequence with edits random deletions, insertions, substitutions and transpositions of neighbours
+    mutated = list(sequence)
+    for _ in range(edits):
+        kind = rng.random()
+        position = rng.randint(0, len(mutated))
+        if kind < 0.3 and mutated:
+            del mutated[min(position, len(mutated) - 1)]
+        elif kind < 0.6:
+            mutated.insert(position, rng.randrange(alphabet))
+        elif kind < 0.8 and mutated:
+            mutated[min(position, len(mutated) - 1)] = rng.randrange(alphabet)
+        elif len(mutated) > 1:
+            index = rng.randrange(len(mutated) - 1)
+            mutated[index], mutated[index + 1] = mutated[index + 1], mutated[index]
+    return tuple(mutated)
+
+
+def random_pair(rng, length, edit_fraction, alphabet):
+    seq1 = tuple([rng.randrange(alphabet) for _ in range(length)])
+    return seq1, mutate(rng, seq1, alphabet, int(length * edit_fraction))
+
+
+def dmp_diff(seq1, seq2, timeout):
+    # diff_main over the ids as characters (offset by one, since diff_linesToWords never uses chr(0)), as tuples
+    dmp = dmp_module.diff_match_patch()
+    dmp.Diff_Timeout = timeout
+    diffs = dmp.diff_main("".join([chr(item + 1) for item in seq1]), "".join([chr(item + 1) for item in seq2]), False)
+    return [(op, tuple([ord(char) - 1 for char in text])) for op, text in diffs]
+
+
+def check_random(rounds, seed=1):
+    # number of failed checks on random pairs
+    rng = random.Random(seed)
+    pairs = [random_pair(rng, rng.randint(0, 80), rng.random(), rng.choice((3, 5, 10, 40))) for _ in range(rounds)]
+    failures = 0
+    for timeout, name in TIMEOUTS:
+        sequence_mismatches = 0
+        for seq1, seq2 in pairs:
+            if diff_sequence.diff_sequences(seq1, seq2, timeout) != dmp_diff(seq1, seq2, timeout):
+                sequence_mismatches += 1
+        print(f"{rounds} random pairs, {name}: sequence {sequence_mismatches} mismatches")
+        failures += sequence_mismatches
+    return failures
+
+
+def status_counts(comparisons):
+    return collections.Counter([comparison.status for comparison in comparisons])
+
+
+def span_statuses(session, span):
+    # status counts of a --span run over the session's editions, with the sequence engine
+    source, compare = session.editions[:2]
+    diff = functools.partial(span_compare.diff_span, engine="sequence")
+    return status_counts(span_compare.iter_span_comparisons(
+        iter(session.verses[source][identifier] for identifier in session.identifiers[source]),
+        iter(session.verses[compare][identifier] for identifier in session.identifiers[compare]),
+        span, diff, session.vocabulary, False))
+
+
+def check_corpus(editions=("n1904", "sblgnt")):
+    # number of failed checks comparing the bundled editions with every engine and span
+    failures = 0
+    diffs = {}
+    counts = {}
+    for engine in ("dmp", "sequence"):
+        session = comparison_session.ComparisonSession(editions, engine=engine, transpositions=False)
+        comparisons = session.compare()
+        diffs[engine] = [comparison.diff for comparison in comparisons]
+        counts[engine] = status_counts(comparisons)
+    # sequence-engine sessions intern ids rather than chr() text, which is what --span needs
+    for span in ("chapter", "book"):
+        counts[f"span {span}"] = span_statuses(session, span)
+    for name, run_counts in counts.items():
+        same = run_counts == counts["dmp"]
+        failures += not same
+        print(f"{name:<12} {dict(run_counts)}{'' if same else '  MISMATCH'}")
+    sequence_mismatches = sum([a != b for a, b in zip(diffs["dmp"], diffs["sequence"])])
+    print(f"verse diffs: sequence {sequence_mismatches} mismatches")
+    return failures + sequence_mismatches
+
+
+def bench(seed=2):
+    rng = random.Random(seed)
+    print(f"{'words':>6} {'edited':>7} {'dmp ms':>8} {'sequence ms':>12}")
+    for length, edit_fraction in BENCH_SIZES:
+        pairs = [random_pair(rng, length // 2, edit_fraction, 200) for _ in range(BENCH_PAIRS)]
+        timings = []
+        for diff in (functools.partial(dmp_diff, timeout=1.0), diff_sequence.diff_sequences):
+            start = time.perf_counter()
+            for seq1, seq2 in pairs:
+                diff(seq1, seq2)
+            timings.append((time.perf_counter() - start) / BENCH_PAIRS * 1000)
+        print(f"{length:>6} {edit_fraction:>6.0%} {timings[0]:>8.3f} {timings[1]:>12.3f}")
+
+
+def main():
+    rounds = int(sys.argv[1]) if len(sys.argv) > 1 else 10000
+    failures = check_random(rounds)
+    failures += check_corpus()
+    bench()
+    print(f"{failures} failed checks")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
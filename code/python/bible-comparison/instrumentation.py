@@ -0,0 +1,179 @@
+"""Opt-in timing of the stages of a comparison run.
+
+Turned on by --instrument or by setting BIBLE_COMPARISON_INSTRUMENT=1.
+install() wraps the functions behind each stage with a timer and
+uninstall() puts the originals back, so an ordinary run pays nothing. The
+stages:
+- bcvid: BCVID parsing of the TSV verse ids
+- normalization: building the normalized verse text (get_verse_text() and its
+  --compact, --cache-dir and --intern equivalents)
+- tokenization: splitting verse texts into words for the diff
+  (diff_linesToWords, or encoding for --intern and the other engines)
+- diff: diff_main, which includes half_match and bisection
+- half_match: diff_halfMatch looking for a split
+- bisection: diff_bisect
+- detokenization: turning the diff back into text
+- printing: the report's print() calls
+Calls counts every call of a stage, including recursive ones, while seconds
+only counts the outermost, so nested calls aren't counted twice. The
+functions are patched in comparison_core, which every front end calls. The
+diffs of --workers run in other processes, so the two can't be combined.
+
+Each verse pair is timed and the slowest --slowest pairs are listed. The
+DiffStats of the run add up the diff_bisect calls and the halfMatch splits
+taken instead. --profile START-END runs cProfile over the verse pairs whose
+identifiers fall in that range, where START and END are verse id prefixes
+(40005 is Matthew 5). The stats are saved for pstats to --profile-output and
+the top functions are printed.
+"""
+
+import builtins
+import cProfile
+import heapq
+import io
+import os
+import pstats
+import time
+
+import comparison_core
+import diff_match_patch as dmp_module
+import diff_sequence
+import edition_cache
+
+
+ENV_VAR = "BIBLE_COMPARISON_INSTRUMENT"
+DEFAULT_SLOWEST = 10
+DEFAULT_PROFILE_OUTPUT = "compare_verses.pstats"
+# functions listed from the profile, by cumulative time
+PROFILE_LINES = 20
+
+
+def enabled_by_environment():
+    return os.environ.get(ENV_VAR, "") not in ("", "0")
+
+
+def stage_targets():
+    # (owner, attribute, stage) for every function wrapped by install()
+    dmp = dmp_module.diff_match_patch
+    sequence = diff_sequence.SequenceDiff
+    return [
+        (comparison_core, "BCVID", "bcvid"),
+        (comparison_core, "get_verse_text", "normalization"),
+        (comparison_core, "compact_verse_text", "normalization"),
+        (comparison_core, "normalize_word", "normalization"),
+        (comparison_core, "encode_verse_text", "tokenization"),
+        (comparison_core, "encode_verse_ids", "tokenization"),
+        (comparison_core, "print", "printing"),
+        (edition_cache, "cached_verse_text", "normalization"),
+        (dmp, "diff_linesToWords", "tokenization"),
+        (dmp, "diff_main", "diff"),
+        (sequence, "diff_main", "diff"),
+        (dmp, "diff_halfMatch", "half_match"),
+        (sequence, "diff_halfMatch", "half_match"),
+        (dmp, "diff_bisect", "bisection"),
+        (sequence, "diff_bisect", "bisection"),
+        (dmp, "diff_charsToLines", "detokenization"),
+        (diff_sequence, "diff_text", "detokenization"),
+    ]
+
+
+class Instrumentation:
+    def __init__(self, slowest=DEFAULT_SLOWEST, profile_range=None, profile_output=DEFAULT_PROFILE_OUTPUT):
+        # stage: [seconds, calls]
+        self.stages = {}
+        self.depth = {}
+        # min-heap of the slowest verse pairs as (seconds, identifier, usfm)
+        self.slowest = slowest
+        self.pairs = []
+        self.stats = comparison_core.DiffStats()
+        self.profile_range = comparison_core.parse_verse_range(profile_range) if profile_range else None
+        self.profile_output = profile_output
+        self.profiler = cProfile.Profile() if profile_range else None
+        self.profiled_pairs = 0
+        # (owner, attribute, original or None if the owner didn't define it itself)
+        self.originals = []
+
+    def timed(self, stage, function):
+        totals = self.stages.setdefault(stage, [0.0, 0])
+        depth = self.depth
+        depth[stage] = 0
+        clock = time.perf_counter
+
+        def wrapper(*args, **kwargs):
+            totals[1] += 1
+            if depth[stage]:
+                return function(*args, **kwargs)
+            depth[stage] = 1
+            start = clock()
+            try:
+                return function(*args, **kwargs)
+            finally:
+                totals[0] += clock() - start
+                depth[stage] = 0
+
+        return wrapper
+
+    def timed_pair(self, function):
+        clock = time.perf_counter
+
+        def wrapper(source_verse, compare_verse, *args, **kwargs):
+            verse = source_verse or compare_verse
+            profiling = (self.profiler is not None
+                         and comparison_core.in_verse_range(verse.identifier, self.profile_range))
+            if profiling:
+                self.profiled_pairs += 1
+                self.profiler.enable()
+            start = clock()
+            comparison = function(source_verse, compare_verse, *args, **kwargs)
+            seconds = clock() - start
+            if profiling:
+                self.profiler.disable()
+            entry = (seconds, verse.identifier, verse.usfm)
+            if len(self.pairs) < self.slowest:
+                heapq.heappush(self.pairs, entry)
+            elif self.slowest:
+                heapq.heappushpop(self.pairs, entry)
+            return comparison
+
+        return wrapper
+
+    def patch(self, owner, attribute, replacement):
+        owned = attribute in vars(owner)
+        self.originals.append((owner, attribute, getattr(owner, attribute) if owned else None))
+        setattr(owner, attribute, replacement)
+
+    def install(self):
+        for owner, attribute, stage in stage_targets():
+            # the report's print() resolves to the builtin unless comparison_core has its own
+            function = getattr(owner, attribute, None) or getattr(builtins, attribute)
+            self.patch(owner, attribute, self.timed(stage, function))
+        self.patch(comparison_core, "compare_verse_pair", self.timed_pair(comparison_core.compare_verse_pair))
+
+    def uninstall(self):
+        for owner, attribute, original in reversed(self.originals):
+            if original is None:
+                delattr(owner, attribute)
+            else:
+                setattr(owner, attribute, original)
+        self.originals = []
+
+    def report(self):
+        print("Instrumentation:")
+        print(f"{'stage':<16} {'calls':>10} {'seconds':>9}")
+        for stage, (seconds, calls) in self.stages.items():
+            if calls:
+                print(f"{stage:<16} {calls:>10} {seconds:>9.3f}")
+        print(f"Diff bisect calls: {self.stats.bisect_calls}, halfMatch splits: {self.stats.half_matches} "
+              f"(in {self.stats.diffs} diffs)")
+        if self.pairs:
+            print(f"Slowest {len(self.pairs)} verse pairs:")
+            for seconds, identifier, usfm in sorted(self.pairs, reverse=True):
+                print(f"{usfm} ({identifier}) {seconds * 1000:.3f} ms")
+        if self.profiler is not None:
+            self.profiler.dump_stats(self.profile_output)
+            print(f"Profile of {self.profiled_pairs} verse pairs in {'-'.join(self.profile_range)} "
+                  f"saved to {self.profile_output}")
+            if self.profiled_pairs:
+                output = io.StringIO()
+                pstats.Stats(self.profiler, stream=output).sort_stats("cumulative").print_stats(PROFILE_LINES)
+                print(output.getvalue().rstrip())
@@ -0,0 +1,74 @@
+"""Compare the memory held by a fully loaded edition in each in-memory layout.
+
+Each layout is loaded under tracemalloc and the size still allocated once
+loading finishes is reported, along with the peak during the load.
+
+    python memory_report.py [edition]
+"""
+
+import dataclasses
+import gc
+import sys
+import tracemalloc
+
+import comparison_core
+
+
+# the Word/Verse layout before slots were added, kept here as the baseline to measure against
+@dataclasses.dataclass
+class DictWord:
+    identifier: str
+    text: str
+
+
+@dataclasses.dataclass
+class DictVerse:
+    identifier: str
+    book: str
+    chapter: str
+    verse: str
+    usfm: str
+    words: dict
+
+
+def load_dict_lines(edition, edition_file_name):
+    return_lines = {}
+    for verse in comparison_core.iter_verses(edition, edition_file_name):
+        words = {word.identifier: DictWord(word.identifier, word.text) for word in verse.words.values()}
+        return_lines[verse.identifier] = DictVerse(verse.identifier, verse.book, verse.chapter, verse.verse,
+                                                   verse.usfm, words)
+    return return_lines
+
+
+def measure(load):
+    gc.collect()
+    tracemalloc.start()
+    loaded = load()
+    current, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return loaded, current, peak
+
+
+def main():
+    edition = sys.argv[1] if len(sys.argv) > 1 else "n1904"
+    edition_file_name = f"{edition}-verses.tsv"
+    layouts = [
+        ("dataclass Verse/Word", lambda: load_dict_lines(edition, edition_file_name)),
+        ("slotted Verse/Word", lambda: comparison_core.load_lines(edition, edition_file_name)),
+        ("CompactVerse", lambda: comparison_core.load_compact_lines(edition, edition_file_name)),
+    ]
+    results = []
+    for name, load in layouts:
+        loaded, current, peak = measure(load)
+        results.append((name, len(loaded), current, peak))
+        del loaded
+
+    baseline = results[0][2]
+    print(f"{'layout':<22} {'verses':>7} {'resident':>12} {'peak':>12} {'vs baseline':>12}")
+    for name, verse_count, current, peak in results:
+        print(f"{name:<22} {verse_count:>7} {current / 2**20:>10.1f}MB {peak / 2**20:>10.1f}MB "
+              f"{current / baseline:>11.1%}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Compare several editions in one run.
+
+Each edition is parsed and normalized once and interned into a single
+Vocabulary shared by all of them, so the same word has the same id in every
+edition. Each requested pair is then compared the same way --intern compares
+two editions, against those preloaded encodings, so adding an edition costs
+one more load rather than a re-parse of every edition for each pair.
+"""
+
+import itertools
+
+import comparison_core
+import edition_cache
+
+
+def edition_pairs(editions, matrix=False):
+    # (source, compare) pairs: the first edition against each of the others, or with matrix every pair once
+    if matrix:
+        return list(itertools.combinations(editions, 2))
+    return [(editions[0], edition) for edition in editions[1:]]
+
+
+def load_interned_edition(edition, vocabulary, encode, cache_dir=None):
+    # list of InternedVerse in file order. encode is encode_verse_ids() or encode_verse_text()
+    if cache_dir:
+        verses = edition_cache.load_edition(edition, f"{edition}-verses.tsv", cache_dir).verses()
+        verse_text = edition_cache.cached_verse_text
+    else:
+        verses = comparison_core.iter_verses(edition, f"{edition}-verses.tsv")
+        verse_text = comparison_core.get_verse_text
+    return list(comparison_core.intern_verses(verses, vocabulary, verse_text, encode))
+
+
+def load_interned_editions(editions, vocabulary, encode, cache_dir=None):
+    # dict[edition, list of InternedVerse], every edition encoded against the one vocabulary
+    return {edition: load_interned_edition(edition, vocabulary, encode, cache_dir) for edition in editions}
+
+
+def iter_pair_comparisons(interned_editions, pairs, diff, merge_join=False):
+    # yields (source edition, compare edition, comparisons) for each pair. diff takes two encodings.
+    for source_edition, compare_edition in pairs:
+        source_verses = interned_editions[source_edition]
+        compare_verses = interned_editions[compare_edition]
+        if merge_join:
+            comparisons = comparison_core.iter_merge_comparisons(source_verses, compare_verses,
+                                                                 comparison_core.interned_verse_text, diff)
+        else:
+            source_gnt_lines = {verse.identifier: verse for verse in source_verses}
+            compare_gnt_lines = {verse.identifier: verse for verse in compare_verses}
+            comparisons = comparison_core.iter_comparisons(source_gnt_lines, compare_gnt_lines,
+                                                           comparison_core.interned_verse_text, diff)
+        yield source_edition, compare_edition, comparisons
@@ -0,0 +1,163 @@
+"""Compare two editions on a process pool, one task per book.
+
+The parent only scans each TSV for the byte ranges that hold each book. A task
+is just those offsets, so the corpus is never pickled; each worker reads and
+parses its own book's lines. Results come back per book and are yielded in
+canonical BCV order, so the output matches a single-process run line for line.
+With --intern or another --engine, each worker interns its books into a
+vocabulary of its own and diffs them with that engine.
+
+With --store-dir the parent opens (or builds) each edition's EditionStore and
+a task is a range of verse indexes in it instead. Each worker maps the same
+store files, which the page cache holds once for every process, and only
+decodes the verses whose digests differ.
+"""
+
+import concurrent.futures
+import functools
+import io
+import multiprocessing
+import multiprocessing.connection
+import os
+import threading
+
+import comparison_core
+import edition_store
+
+
+def book_ranges(path):
+    # dict[book id, list of (start, end) byte ranges], one range per contiguous run of that book's lines
+    ranges = {}
+    offset = 0
+    start = 0
+    current_book = None
+    with open(path, 'rb') as infile:
+        for line in infile:
+            if not line.startswith(b'Verse'):
+                book = line[:2].decode('utf-8', 'replace')
+                if book != current_book:
+                    if current_book is not None:
+                        ranges.setdefault(current_book, []).append((start, offset))
+                    current_book = book
+                    start = offset
+            offset += len(line)
+    if current_book is not None:
+        ranges.setdefault(current_book, []).append((start, offset))
+    return ranges
+
+
+def store_book_ranges(store):
+    # book_ranges() for an EditionStore: dict[book id, list of (start, end) verse index ranges]
+    ranges = {}
+    start = 0
+    for index in range(1, len(store) + 1):
+        if index == len(store) or store.verse_ids[index] // 1000000 != store.verse_ids[start] // 1000000:
+            ranges.setdefault(f"{store.verse_ids[start] // 1000000:02d}", []).append((start, index))
+            start = index
+    return ranges
+
+
+def read_verses(path, ranges):
+    with open(path, 'rb') as infile:
+        for start, end in ranges:
+            infile.seek(start)
+            # TextIOWrapper gives the same newline handling as the open() in iter_verses()
+            lines = io.TextIOWrapper(io.BytesIO(infile.read(end - start)), encoding='utf-8')
+            yield from comparison_core.parse_verses(lines)
+
+
+def read_store_verses(store, ranges):
+    for start, end in ranges:
+        for index in range(start, end):
+            yield store[index]
+
+
+def watch_parent():
+    # pool initializer: end this worker as soon as the parent process is gone. a parent that is killed
+    # outright never shuts its pool down, and orphaned workers would keep running (and, with --shared-memory,
+    # keep the resource tracker and so the segment alive)
+    parent = multiprocessing.parent_process()
+    if parent is None:
+        return
+
+    def wait_for_parent():
+        multiprocessing.connection.wait([parent.sentinel])
+        os._exit(1)
+
+    threading.Thread(target=wait_for_parent, daemon=True).start()
+
+
+def compare_book(task):
+    # runs in a worker. returns (comparisons in report order, compare-only verses), because the
+    # default mode reports compare-only verses after every book rather than inline.
+    source_path, source_ranges, compare_path, compare_ranges, merge_join, engine, intern, stored = task
+    if not stored:
+        return compare_book_verses(read_verses(source_path, source_ranges), read_verses(compare_path, compare_ranges),
+                                   merge_join, engine, intern)
+    # the paths are EditionStores and the ranges verse indexes. the comparisons hold no views into the
+    # mappings, so the stores can be closed once the book is done
+    with edition_store.EditionStore(source_path) as source_store, \
+            edition_store.EditionStore(compare_path) as compare_store:
+        return compare_book_verses(read_store_verses(source_store, source_ranges),
+                                   read_store_verses(compare_store, compare_ranges),
+                                   merge_join, engine, intern, comparison_core.stored_verse_digest)
+
+
+def compare_book_verses(source_verses, compare_verses, merge_join, engine, intern, verse_digest=None):
+    verse_text = comparison_core.get_verse_text
+    diff = comparison_core.diff_wordMode
+    if intern or engine != "dmp":
+        # diffs come back as text, so the word ids never have to leave this worker
+        vocabulary = comparison_core.Vocabulary()
+        encode, diff_encoded = comparison_core.engine_encoding(engine)
+        source_verses = comparison_core.intern_verses(source_verses, vocabulary, verse_text, encode)
+        compare_verses = comparison_core.intern_verses(compare_verses, vocabulary, verse_text, encode)
+        verse_text = comparison_core.interned_verse_text
+        # interned verses compare their encoded tokens instead
+        verse_digest = None
+        diff = functools.partial(diff_encoded, vocabulary=vocabulary)
+    if merge_join:
+        return list(comparison_core.iter_merge_comparisons(source_verses, compare_verses, verse_text, diff,
+                                                           verse_digest)), []
+
+    source_gnt_lines = {verse.identifier: verse for verse in source_verses}
+    compare_gnt_lines = {verse.identifier: verse for verse in compare_verses}
+    comparisons = []
+    compare_only = []
+    for comparison in comparison_core.iter_comparisons(source_gnt_lines, compare_gnt_lines, verse_text, diff,
+                                                       verse_digest):
+        if comparison.status == comparison_core.COMPARE_ONLY:
+            compare_only.append(comparison)
+        else:
+            comparisons.append(comparison)
+    return comparisons, compare_only
+
+
+def iter_parallel_comparisons(source_edition, source_file_name, compare_edition, compare_file_name, workers,
+                              merge_join=False, engine="dmp", intern=False, store_dir=None):
+    # store_dir, if given, is the --store-dir the workers read the editions from instead of the TSV files
+    paths = []
+    books = []
+    for edition, edition_file_name in ((source_edition, source_file_name), (compare_edition, compare_file_name)):
+        print(f"Loading {edition}")
+        if store_dir:
+            # built here if missing or stale, so the workers only ever open it
+            with edition_store.open_store(edition, edition_file_name, store_dir) as store:
+                paths.append(store.path)
+                books.append(store_book_ranges(store))
+        else:
+            paths.append(comparison_core.edition_path(edition_file_name))
+            books.append(book_ranges(paths[-1]))
+    source_path, compare_path = paths
+    source_books, compare_books = books
+
+    tasks = [(source_path, source_books.get(book, []), compare_path, compare_books.get(book, []), merge_join,
+              engine, intern, bool(store_dir))
+             for book in sorted(set(source_books) | set(compare_books))]
+    compare_only = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=watch_parent) as executor:
+        # map() hands results back in task order, i.e. book order, whichever worker finishes first
+        for comparisons, book_compare_only in executor.map(compare_book, tasks):
+            yield from comparisons
+            compare_only.extend(book_compare_only)
+    yield from compare_only
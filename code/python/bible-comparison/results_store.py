@@ -0,0 +1,185 @@
+"""Load comparison results into a SQLite database for querying.
+
+ResultsStore takes the same write() calls as comparison_writer.ComparisonWriter
+and fills these tables:
+- editions: one row per edition compared
+- comparisons: one row per verse pair, with verse id, USFM book, reference
+  and status
+- ops: one row per op of each difference, with its text and token spans
+- tokens: one row per word of each deleted or inserted op, with its word
+  identifier, so differences can be looked up by word
+- transpositions and moves: from word_order and --span
+Rows are buffered and inserted with executemany in batches, all in one
+transaction. The indexes are only built once everything is loaded, which is
+much faster than updating them row by row. The load goes to a temp file that
+replaces an existing database only once it is complete, so a failed run
+leaves the previous database as it was.
+
+    python results_store.py RESULTS.sqlite TOKEN [--book ROM]
+
+lists the differences involving a word, e.g. every difference in Romans that
+adds or omits Ἰησοῦ.
+"""
+
+import argparse
+import os
+import sqlite3
+
+import comparison_writer
+import comparison_core
+import diff_sequence
+
+
+# rows held per table before they are inserted in one executemany
+BATCH_ROWS = 10000
+
+SCHEMA = [
+    "CREATE TABLE editions (id INTEGER PRIMARY KEY, name TEXT NOT NULL UNIQUE)",
+    "CREATE TABLE comparisons (id INTEGER PRIMARY KEY, source INTEGER NOT NULL, compare INTEGER NOT NULL, "
+    "verse_id INTEGER NOT NULL, book TEXT NOT NULL, usfm TEXT NOT NULL, status TEXT NOT NULL)",
+    "CREATE TABLE ops (comparison INTEGER NOT NULL, position INTEGER NOT NULL, op INTEGER NOT NULL, "
+    "text TEXT NOT NULL, source_start INTEGER NOT NULL, source_end INTEGER NOT NULL, "
+    "compare_start INTEGER NOT NULL, compare_end INTEGER NOT NULL)",
+    "CREATE TABLE tokens (comparison INTEGER NOT NULL, position INTEGER NOT NULL, op INTEGER NOT NULL, "
+    "token TEXT NOT NULL, word_id TEXT NOT NULL)",
+    "CREATE TABLE transpositions (comparison INTEGER NOT NULL, text TEXT NOT NULL, "
+    "delete_position INTEGER NOT NULL, insert_position INTEGER NOT NULL)",
+    "CREATE TABLE moves (comparison INTEGER NOT NULL, op INTEGER NOT NULL, text TEXT NOT NULL, "
+    "other_verse_id INTEGER NOT NULL)",
+]
+# built after the load
+INDEXES = [
+    "CREATE INDEX comparisons_verse ON comparisons (verse_id)",
+    "CREATE INDEX comparisons_book ON comparisons (book, status)",
+    "CREATE INDEX ops_comparison ON ops (comparison)",
+    "CREATE INDEX tokens_token ON tokens (token)",
+    "CREATE INDEX tokens_comparison ON tokens (comparison)",
+]
+INSERTS = {
+    "comparisons": "INSERT INTO comparisons VALUES (?, ?, ?, ?, ?, ?, ?)",
+    "ops": "INSERT INTO ops VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+    "tokens": "INSERT INTO tokens VALUES (?, ?, ?, ?, ?)",
+    "transpositions": "INSERT INTO transpositions VALUES (?, ?, ?, ?)",
+    "moves": "INSERT INTO moves VALUES (?, ?, ?, ?)",
+}
+
+
+class ResultsStore:
+    def __init__(self, path):
+        self.path = path
+        self.temp_path = f"{path}.{os.getpid()}.tmp"
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+        self.connection = sqlite3.connect(self.temp_path)
+        # a failed load is thrown away and rerun, so nothing needs to survive a crash part way through
+        self.connection.execute("PRAGMA journal_mode = OFF")
+        self.connection.execute("PRAGMA synchronous = OFF")
+        for statement in SCHEMA:
+            self.connection.execute(statement)
+        self.connection.execute("BEGIN")
+        self.editions = {}
+        self.rows = {table: [] for table in INSERTS}
+        self.comparison_id = 0
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        if exc_type is None:
+            self.close()
+        else:
+            self.abort()
+
+    def edition_id(self, edition):
+        edition_id = self.editions.get(edition)
+        if edition_id is None:
+            edition_id = self.editions[edition] = len(self.editions) + 1
+            self.connection.execute("INSERT INTO editions VALUES (?, ?)", (edition_id, edition))
+        return edition_id
+
+    def add(self, table, row):
+        rows = self.rows[table]
+        rows.append(row)
+        if len(rows) >= BATCH_ROWS:
+            self.connection.executemany(INSERTS[table], rows)
+            rows.clear()
+
+    def write(self, comparison, source_edition, compare_edition):
+        self.comparison_id += 1
+        comparison_id = self.comparison_id
+        identifier = comparison.identifier
+        self.add("comparisons", (comparison_id, self.edition_id(source_edition), self.edition_id(compare_edition),
+                                 int(identifier), comparison.usfm.split(' ')[0], comparison.usfm, comparison.status))
+        if comparison.diff is not None:
+            for position, op in enumerate(comparison_writer.diff_ops(identifier, comparison.diff)):
+                source_start, source_end = op["source"]
+                compare_start, compare_end = op["compare"]
+                self.add("ops", (comparison_id, position, op["op"], op["text"], source_start, source_end,
+                                 compare_start, compare_end))
+                if op["op"] == diff_sequence.DIFF_EQUAL:
+                    continue
+                # the words of an edit, numbered in the edition they are in
+                start = source_start if op["op"] == diff_sequence.DIFF_DELETE else compare_start
+                words = op["text"].split(' ')
+                if op["text"].endswith(' '):
+                    words.pop()
+                for offset, token in enumerate(words):
+                    self.add("tokens", (comparison_id, position, op["op"], token,
+                                        identifier + str(start + offset + 1).zfill(3)))
+        for text, delete_position, insert_position in comparison.transposed or []:
+            self.add("transpositions", (comparison_id, text, delete_position, insert_position))
+        for op, text, other in comparison.moved or []:
+            self.add("moves", (comparison_id, op, text, int(other)))
+
+    def close(self):
+        if self.connection is None:
+            return
+        for table, rows in self.rows.items():
+            self.connection.executemany(INSERTS[table], rows)
+            rows.clear()
+        for statement in INDEXES:
+            self.connection.execute(statement)
+        self.connection.commit()
+        self.connection.execute("ANALYZE")
+        self.connection.close()
+        self.connection = None
+        os.replace(self.temp_path, self.path)
+
+    def abort(self):
+        # drop a load that failed part way; the database at path, if any, is left untouched
+        if self.connection is None:
+            return
+        self.connection.close()
+        self.connection = None
+        os.remove(self.temp_path)
+
+
+def differences_with_token(connection, token, book=None):
+    # (usfm, source edition, compare edition, op, op text) for every edit of a difference that adds or omits token.
+    # token is normalized the way verse text is; book is a USFM book code, e.g. ROM
+    query = ("SELECT DISTINCT c.usfm, s.name, k.name, o.op, o.text FROM tokens t "
+             "JOIN comparisons c ON c.id = t.comparison "
+             "JOIN ops o ON o.comparison = t.comparison AND o.position = t.position "
+             "JOIN editions s ON s.id = c.source JOIN editions k ON k.id = c.compare "
+             "WHERE t.token = ?")
+    parameters = [comparison_core.normalize_word(token)]
+    if book is not None:
+        query += " AND c.book = ?"
+        parameters.append(book.upper())
+    return connection.execute(query + " ORDER BY c.verse_id, c.source, c.compare, o.position", parameters).fetchall()
+
+
+def main():
+    parser = argparse.ArgumentParser(description="List the differences in a results database involving a word.")
+    parser.add_argument("database")
+    parser.add_argument("token")
+    parser.add_argument("--book", help="only this USFM book, e.g. ROM")
+    args = parser.parse_args()
+    connection = sqlite3.connect(args.database)
+    for usfm, source, compare, op, text in differences_with_token(connection, args.token, args.book):
+        print(f"{usfm}\t{source}\t{compare}\t{op}\t{text}")
+    connection.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,199 @@
+"""Publish encoded editions once in shared memory for pool workers.
+
+The parent packs every edition's verse ids, verse start offsets and word
+token ids, plus one vocabulary shared by all of them, into a single
+multiprocessing.shared_memory segment. Workers attach to it by name in the
+pool initializer and read verses as memoryview slices of that segment, so
+the corpus is never pickled. Token ids are diff words (a normalized word
+plus its trailing space, as diff_linesToWords() splits them) in a vocabulary
+shared across editions, so a pair of slices goes straight to the
+diff_sequence engine. The dmp engine diffs the same ids as chr() characters,
+which is the --intern encoding.
+
+The segment is unlinked when the SharedCorpus context exits, at interpreter
+exit, or, if the parent is killed outright, by multiprocessing's resource
+tracker. The tracker only does that once every process sharing it has
+exited, so workers watch their parent (parallel_compare.watch_parent()) and
+exit as soon as it is gone.
+"""
+
+import array
+import atexit
+import concurrent.futures
+from multiprocessing import shared_memory
+
+import comparison_core
+import diff_match_patch as dmp_module
+import diff_sequence
+import edition_cache
+import parallel_compare
+
+
+# verse pairs per pool task
+CHUNK_SIZE = 512
+
+# the corpus a pool worker attached to in attach_worker()
+worker_corpus = None
+
+
+class SharedCorpus:
+    def __init__(self, memory, owner, engine="dmp"):
+        self.memory = memory
+        self.owner = owner
+        self.engine = engine
+        self.header, data_start = edition_cache.read_header(memory.buf)
+        self.views = []
+
+        def section(name):
+            view = edition_cache.read_section(memory.buf, self.header, data_start, name)
+            self.views.append(view)
+            return view
+
+        self.editions = self.header["editions"]
+        self.verse_ids = [section(f"{index}.verse_ids") for index in range(len(self.editions))]
+        self.verse_starts = [section(f"{index}.verse_starts") for index in range(len(self.editions))]
+        self.token_ids = [section(f"{index}.token_ids") for index in range(len(self.editions))]
+        self.usfm = [edition_cache.unpack_strings(section(f"{index}.usfm"), len(self.verse_ids[index]))
+                     for index in range(len(self.editions))]
+        self.vocabulary = edition_cache.unpack_strings(section("vocabulary"), self.header["vocabulary_count"])
+        if owner:
+            atexit.register(self.close)
+
+    @classmethod
+    def publish(cls, encoded_editions):
+        # encoded_editions: list of edition_cache.EncodedEdition
+        vocabulary = comparison_core.Vocabulary()
+        sections = {}
+        for index, encoded in enumerate(encoded_editions):
+            verse_starts = array.array('I', [0])
+            token_ids = array.array('I')
+            for verse_index in range(len(encoded)):
+                token_ids.extend(vocabulary.encode(encoded.verse_text(verse_index)))
+                verse_starts.append(len(token_ids))
+            sections[f"{index}.verse_ids"] = encoded.verse_ids
+            sections[f"{index}.verse_starts"] = verse_starts
+            sections[f"{index}.token_ids"] = token_ids
+            sections[f"{index}.usfm"] = edition_cache.pack_strings(encoded.usfm)
+        sections["vocabulary"] = edition_cache.pack_strings(vocabulary.words)
+        header = {"editions": [encoded.edition for encoded in encoded_editions], "vocabulary_count": len(vocabulary)}
+        packed = edition_cache.pack_sections(header, sections)
+
+        memory = shared_memory.SharedMemory(create=True, size=len(packed))
+        try:
+            memory.buf[:len(packed)] = packed
+            return cls(memory, owner=True)
+        except BaseException:
+            memory.close()
+            memory.unlink()
+            raise
+
+    @classmethod
+    def attach(cls, name, engine="dmp"):
+        return cls(shared_memory.SharedMemory(name=name), owner=False, engine=engine)
+
+    @property
+    def name(self):
+        return self.memory.name
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def verse_tokens(self, edition_index, verse_index):
+        # zero-copy slice of one verse's token ids
+        verse_starts = self.verse_starts[edition_index]
+        return self.token_ids[edition_index][verse_starts[verse_index]:verse_starts[verse_index + 1]]
+
+    def diff(self, tokens1, tokens2):
+        # diff_wordMode() on two token slices, with the run's --engine
+        if self.engine == "dmp":
+            dmp = dmp_module.diff_match_patch()
+            diffs = dmp.diff_main("".join(map(chr, tokens1)), "".join(map(chr, tokens2)), False)
+            dmp.diff_charsToLines(diffs, self.vocabulary)
+            return diffs
+        return diff_sequence.diff_text(diff_sequence.diff_sequences(tokens1, tokens2), self.vocabulary)
+
+    def compare(self, source_edition, source_index, compare_edition, compare_index):
+        # VerseComparison for one pair of verse indexes; -1 means the verse is missing from that edition
+        if compare_index < 0:
+            return comparison_core.VerseComparison(f"{self.verse_ids[source_edition][source_index]:08d}",
+                                                   self.usfm[source_edition][source_index],
+                                                   comparison_core.SOURCE_ONLY)
+        if source_index < 0:
+            return comparison_core.VerseComparison(f"{self.verse_ids[compare_edition][compare_index]:08d}",
+                                                   self.usfm[compare_edition][compare_index],
+                                                   comparison_core.COMPARE_ONLY)
+        identifier = f"{self.verse_ids[source_edition][source_index]:08d}"
+        usfm = self.usfm[source_edition][source_index]
+        tokens1 = self.verse_tokens(source_edition, source_index)
+        tokens2 = self.verse_tokens(compare_edition, compare_index)
+        if tokens1 == tokens2:
+            return comparison_core.VerseComparison(identifier, usfm, comparison_core.MATCH)
+        return comparison_core.VerseComparison(identifier, usfm, comparison_core.DIFFERENCE,
+                                               self.diff(tokens1, tokens2))
+
+    def verse_pairs(self, source_edition, compare_edition, merge_join=False):
+        # (source index, compare index) in report order, -1 for a missing side. like the default mode,
+        # compare-only verses go last unless merge_join puts them inline.
+        source_ids = self.verse_ids[source_edition]
+        compare_ids = self.verse_ids[compare_edition]
+        compare_lookup = {verse_id: index for index, verse_id in enumerate(compare_ids)}
+        source_lookup = {verse_id: index for index, verse_id in enumerate(source_ids)}
+        pairs = [(source_lookup[verse_id], compare_lookup.get(verse_id, -1)) for verse_id in sorted(source_lookup)]
+        compare_only = [(-1, index) for index, verse_id in enumerate(compare_ids) if verse_id not in source_lookup]
+        if merge_join:
+            return sorted(pairs + compare_only,
+                          key=lambda pair: source_ids[pair[0]] if pair[0] >= 0 else compare_ids[pair[1]])
+        return pairs + compare_only
+
+    def close(self):
+        # views into the segment have to be released before it can be closed
+        for view in self.views:
+            view.release()
+        self.views = []
+        if self.memory is None:
+            return
+        self.memory.close()
+        if self.owner:
+            self.memory.unlink()
+            atexit.unregister(self.close)
+        self.memory = None
+
+
+def attach_worker(name, engine):
+    # pool initializer: attach once per worker process
+    global worker_corpus
+    parallel_compare.watch_parent()
+    worker_corpus = SharedCorpus.attach(name, engine)
+
+
+def compare_chunk(task):
+    source_edition, compare_edition, pairs = task
+    return [worker_corpus.compare(source_edition, source_index, compare_edition, compare_index)
+            for source_index, compare_index in pairs]
+
+
+def iter_shared_pair_comparisons(encoded_editions, workers, edition_pairs, merge_join=False, engine="dmp"):
+    # publish the editions once, then diff each (source index, compare index) pair of them on one pool
+    # attached to the segment. yields (source index, compare index, comparisons); each pair's comparisons
+    # have to be consumed before the next pair is asked for.
+    with SharedCorpus.publish(encoded_editions) as corpus:
+        with concurrent.futures.ProcessPoolExecutor(max_workers=workers, initializer=attach_worker,
+                                                    initargs=(corpus.name, engine)) as executor:
+            for source_edition, compare_edition in edition_pairs:
+                pairs = corpus.verse_pairs(source_edition, compare_edition, merge_join)
+                tasks = [(source_edition, compare_edition, pairs[start:start + CHUNK_SIZE])
+                         for start in range(0, len(pairs), CHUNK_SIZE)]
+                results = executor.map(compare_chunk, tasks)
+                yield source_edition, compare_edition, (comparison for comparisons in results
+                                                        for comparison in comparisons)
+
+
+def iter_shared_comparisons(encoded_editions, workers, merge_join=False, source_edition=0, compare_edition=1,
+                            engine="dmp"):
+    # the comparisons for one pair of the editions
+    for _, _, comparisons in iter_shared_pair_comparisons(encoded_editions, workers,
+                                                          [(source_edition, compare_edition)], merge_join, engine):
+        yield from comparisons
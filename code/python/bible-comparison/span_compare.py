@@ -0,0 +1,207 @@
+"""Diff whole chapters or books instead of single verses.
+
+Diffing verse by verse can't see text that one edition puts in a neighbouring
+verse, and pays for a separate diff_main setup for each of the ~8,000 verse
+pairs. Here the interned verses of a chapter (or book) are joined into one
+token sequence per edition, with a sentinel token in front of each verse, and
+the two sequences are diffed once. The diff is then split back into one
+VerseComparison per verse, so report() prints the same records as the
+verse-by-verse modes.
+
+Each sentinel is a vocabulary entry of its own ("\\x00" plus the verse id), so
+a verse both editions have is a token that occurs exactly once in each
+sequence. The engines' Diff_AnchorLength split uses those tokens (and any
+word unique to both sides) as fixed points. A chapter diff is then a run of
+verse-sized diffs rather than one bisection over thousands of tokens.
+
+Splitting follows the sentinels on each side. Edits go to the verse they were
+read from. Equal text can lie in one verse in the source edition and in
+another in the compare edition, where the two divide a passage differently.
+That text is recorded as a delete in the first verse and an insert in the
+second, so each verse's diff still turns its own source text into its own
+compare text. It is also listed in VerseComparison.moved, as are deleted and
+inserted runs of the same text in neighbouring verses.
+"""
+
+import comparison_core
+import diff_match_patch as dmp_module
+import diff_sequence
+import word_order
+
+
+DIFF_DELETE = diff_sequence.DIFF_DELETE
+DIFF_INSERT = diff_sequence.DIFF_INSERT
+DIFF_EQUAL = diff_sequence.DIFF_EQUAL
+
+# length of the verse identifier prefix shared by the verses of one span
+SPAN_PREFIX = {"chapter": 5, "book": 2}
+# combined length in tokens above which a span diff is split at tokens unique to both sides
+ANCHOR_LENGTH = 200
+
+
+def sentinel_text(identifier):
+    # WORD_PATTERN strips every non-word character, so no edition word can collide with this
+    return "\x00" + identifier
+
+
+def iter_spans(source_verses, compare_verses, span):
+    # lists of merge_verses() pairs, one list per chapter or book. both streams must be in BCV order.
+    prefix = SPAN_PREFIX[span]
+    pairs = []
+    key = None
+    for pair in comparison_core.merge_verses(source_verses, compare_verses):
+        identifier = (pair[0] or pair[1]).identifier
+        if identifier[:prefix] != key and pairs:
+            yield pairs
+            pairs = []
+        key = identifier[:prefix]
+        pairs.append(pair)
+    if pairs:
+        yield pairs
+
+
+def span_tokens(verses, vocabulary):
+    # word ids of one edition's side of a span, each verse preceded by its sentinel. verses may contain None.
+    ids = []
+    for verse in verses:
+        if verse is None:
+            continue
+        ids.append(vocabulary.intern(sentinel_text(verse.identifier)))
+        if isinstance(verse.tokens, str):
+            ids.extend(map(ord, verse.tokens))
+        else:
+            ids.extend(verse.tokens)
+    return tuple(ids)
+
+
+def diff_span(ids1, ids2, engine="sequence", budget=0, stats=None):
+    # [(op, tuple of ids)] for two span_tokens() sequences, with the --engine differ and Diff_AnchorLength set
+    if engine == "dmp":
+        dmp = dmp_module.diff_match_patch()
+        dmp.Diff_Budget = budget
+        dmp.Diff_AnchorLength = ANCHOR_LENGTH
+        diffs = dmp.diff_main("".join(map(chr, ids1)), "".join(map(chr, ids2)), False)
+        if stats is not None:
+            stats.record(dmp)
+        return [(op, tuple(map(ord, chars))) for op, chars in diffs]
+    differ = diff_sequence.SequenceDiff()
+    differ.Diff_Budget = budget
+    differ.Diff_AnchorLength = ANCHOR_LENGTH
+    diffs = differ.diff_main(ids1, ids2)
+    if stats is not None:
+        stats.record(differ)
+    return diffs
+
+
+def split_span(diffs, sentinels):
+    # ({verse identifier: [(op, [ids], moved)]}, {verse identifier: [(op, [ids], other verse identifier)]}) from
+    # the diff of a span. sentinels maps each sentinel id to its verse identifier. moved marks the pieces that are
+    # equal text the other edition has in a different verse.
+    pieces = {}
+    moved = {}
+
+    def add(identifier, op, run, is_moved=False):
+        verse_pieces = pieces.setdefault(identifier, [])
+        if verse_pieces and verse_pieces[-1][0] == op and verse_pieces[-1][2] == is_moved:
+            verse_pieces[-1][1].extend(run)
+        else:
+            verse_pieces.append((op, list(run), is_moved))
+
+    source_verse = None
+    compare_verse = None
+    for op, ids in diffs:
+        # each op is handled a run at a time, a run being the ids between two sentinels
+        start = 0
+        for position in [index for index, word_id in enumerate(ids) if word_id in sentinels] + [len(ids)]:
+            if start < position:
+                run = ids[start:position]
+                if op == DIFF_EQUAL and source_verse != compare_verse:
+                    # the same text, in a different verse in each edition
+                    add(source_verse, DIFF_DELETE, run, True)
+                    add(compare_verse, DIFF_INSERT, run, True)
+                    moved.setdefault(source_verse, []).append((DIFF_DELETE, run, compare_verse))
+                    moved.setdefault(compare_verse, []).append((DIFF_INSERT, run, source_verse))
+                else:
+                    add(compare_verse if op == DIFF_INSERT else source_verse, op, run)
+            if position < len(ids):
+                identifier = sentinels[ids[position]]
+                if op != DIFF_INSERT:
+                    source_verse = identifier
+                if op != DIFF_DELETE:
+                    compare_verse = identifier
+            start = position + 1
+    return pieces, moved
+
+
+def render_pieces(verse_pieces, words):
+    # (verse diff as (op, text), index in that diff of each piece). adjacent pieces with the same op are merged.
+    diff = []
+    positions = []
+    for op, ids, is_moved in verse_pieces:
+        text = "".join([words[word_id] for word_id in ids])
+        if diff and diff[-1][0] == op:
+            diff[-1] = (op, diff[-1][1] + text)
+        else:
+            diff.append((op, text))
+        positions.append(len(diff) - 1)
+    return diff, positions
+
+
+def span_comparisons(pairs, diffs, sentinels, vocabulary, transpositions=True):
+    # one VerseComparison per merge_verses() pair of the span, in order
+    pieces, moved_ids = split_span(diffs, sentinels)
+    words = vocabulary.words
+    rendered = {identifier: render_pieces(verse_pieces, words) for identifier, verse_pieces in pieces.items()}
+    moved = {identifier: [(op, "".join([words[word_id] for word_id in ids]), other) for op, ids, other in entries]
+             for identifier, entries in moved_ids.items()}
+    identifiers = [(source_verse or compare_verse).identifier for source_verse, compare_verse in pairs]
+
+    transposed = {}
+    if transpositions:
+        # edits other than moved equal text, paired across the span: within one verse they are
+        # transpositions, between neighbouring verses they are moves
+        edits = [(identifier, index, op, "".join([words[word_id] for word_id in ids]), group)
+                 for group, identifier in enumerate(identifiers)
+                 for index, (op, ids, is_moved) in enumerate(pieces.get(identifier, []))
+                 if op != DIFF_EQUAL and not is_moved]
+        for identifier in identifiers:
+            transposed[identifier] = []
+        for text, delete, insert in word_order.find_transpositions([edit[2:4] for edit in edits],
+                                                                   [edit[4] for edit in edits]):
+            delete_identifier, delete_index, _, delete_text, _ = edits[delete]
+            insert_identifier, insert_index, _, insert_text, _ = edits[insert]
+            if delete_identifier == insert_identifier:
+                positions = rendered[delete_identifier][1]
+                transposed[delete_identifier].append((text, positions[delete_index], positions[insert_index]))
+            else:
+                moved.setdefault(delete_identifier, []).append((DIFF_DELETE, delete_text, insert_identifier))
+                moved.setdefault(insert_identifier, []).append((DIFF_INSERT, insert_text, delete_identifier))
+
+    for (source_verse, compare_verse), identifier in zip(pairs, identifiers):
+        verse = source_verse or compare_verse
+        verse_moved = moved.get(identifier) or None
+        if compare_verse is None:
+            status = comparison_core.SOURCE_ONLY
+        elif source_verse is None:
+            status = comparison_core.COMPARE_ONLY
+        else:
+            verse_diff = rendered.get(identifier, ([], []))[0]
+            if all(op == DIFF_EQUAL for op, text in verse_diff):
+                yield comparison_core.VerseComparison(identifier, verse.usfm, comparison_core.MATCH)
+            else:
+                yield comparison_core.VerseComparison(identifier, verse.usfm, comparison_core.DIFFERENCE,
+                                                      verse_diff, verse_moved, transposed.get(identifier))
+            continue
+        yield comparison_core.VerseComparison(identifier, verse.usfm, status, moved=verse_moved)
+
+
+def iter_span_comparisons(source_verses, compare_verses, span, diff, vocabulary, transpositions=True):
+    # VerseComparisons in BCV order, like iter_merge_comparisons(), from one diff per chapter or book.
+    # the verses are InternedVerse and diff is diff_span() (or a partial of it). with transpositions, deleted
+    # and inserted runs of the same text are paired across the span (see word_order).
+    for pairs in iter_spans(source_verses, compare_verses, span):
+        source_ids = span_tokens([source_verse for source_verse, compare_verse in pairs], vocabulary)
+        compare_ids = span_tokens([compare_verse for source_verse, compare_verse in pairs], vocabulary)
+        sentinels = {vocabulary.ids[sentinel_text(verse.identifier)]: verse.identifier
+                     for pair in pairs for verse in pair if verse is not None}
+        yield from span_comparisons(pairs, diff(source_ids, compare_ids), sentinels, vocabulary, transpositions)
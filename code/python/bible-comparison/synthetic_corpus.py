@@ -0,0 +1,197 @@
+"""Generate reproducible variant editions of a seed edition, for scale testing.
+
+Each generated "manuscript" is a copy of the seed edition's TSV with edits
+made at configurable rates:
+- substitution, omission, addition, transposition: per word. A substituted
+  or added word is drawn from the seed's own words, so common words such as
+  καί and the article come up most often. A transposition swaps a word with
+  the one after it.
+- split, merge: per verse, never across a chapter boundary. A split moves the
+  tail of a verse onto the start of the next one. A merge appends the next
+  verse to this one and leaves the next verse out, as an edition that
+  numbers verses differently would.
+The edited verses are written as data/tsv/NAME0001-verses.tsv and so on,
+which --editions reads like any other edition. A manuscript only depends on
+--seed, its number and the rates, so the same command always writes the same
+files. 10 to 1000 manuscripts give workloads 10x to 1000x the size of the
+bundled editions, e.g. for benchmark.py or --editions n1904 NAME0001 ...
+
+Edits are placed by drawing the gap to the next one from a geometric
+distribution instead of drawing once per word. Verses with no edit are
+written out as the seed line unchanged, so a manuscript costs about one pass
+over the seed's lines.
+
+    python synthetic_corpus.py [--manuscripts N] [--seed S] [--name NAME] [--substitution RATE] ...
+"""
+
+import argparse
+import math
+import os
+import random
+import time
+
+import comparison_core
+
+
+WORD_EDITS = ["substitution", "omission", "addition", "transposition"]
+VERSE_EDITS = ["split", "merge"]
+# rates close to the differences between N1904 and SBLGNT, where about one verse in five differs
+DEFAULT_RATES = {"substitution": 0.006, "omission": 0.004, "addition": 0.004, "transposition": 0.002,
+                 "split": 0.002, "merge": 0.001}
+DEFAULT_NAME = "synthetic"
+
+
+def read_seed(edition_file_name):
+    # [(verse id, [words], TSV line)] of an edition, keeping each word as written, punctuation included
+    verses = []
+    with open(comparison_core.edition_path(edition_file_name), 'r', encoding='utf-8') as infile:
+        for line in infile:
+            if line.startswith('Verse'):
+                continue
+            line = line.rstrip('\r\n')
+            verse_id, words = line.split('\t')
+            verses.append((verse_id, words.split(' '), line))
+    return verses
+
+
+def gap(rng, rate):
+    # how many words (or verses) go by before the next edit, for edits made independently at rate
+    if rate <= 0:
+        return math.inf
+    if rate >= 1:
+        return 0
+    return int(math.log(1.0 - rng.random()) / math.log(1.0 - rate))
+
+
+class ManuscriptGenerator:
+    def __init__(self, seed_verses, rates, seed):
+        self.seed_verses = seed_verses
+        self.rates = rates
+        self.seed = seed
+        # every word of the seed, so a drawn word is as common as it is in the seed
+        self.words = [word for verse_id, words, line in seed_verses for word in words]
+
+    def edit_words(self, rng, next_edit, counts):
+        # [(verse id, words, seed line or None if edited)] after the per-word edits
+        verses = []
+        position = 0
+        for verse_id, words, line in self.seed_verses:
+            end = position + len(words)
+            if all(next_edit[edit] >= end for edit in WORD_EDITS):
+                verses.append((verse_id, words, line))
+                position = end
+                continue
+            # word offsets in this verse of each edit
+            offsets = {}
+            for edit in WORD_EDITS:
+                offsets[edit] = set()
+                while next_edit[edit] < end:
+                    offsets[edit].add(next_edit[edit] - position)
+                    next_edit[edit] += 1 + gap(rng, self.rates[edit])
+            edited = []
+            for offset, word in enumerate(words):
+                if offset in offsets["omission"]:
+                    counts["omission"] += 1
+                else:
+                    if offset in offsets["substitution"]:
+                        word = rng.choice(self.words)
+                        counts["substitution"] += 1
+                    edited.append(word)
+                if offset in offsets["addition"]:
+                    edited.append(rng.choice(self.words))
+                    counts["addition"] += 1
+            for offset in sorted(offsets["transposition"]):
+                index = min(offset, len(edited) - 2)
+                if index >= 0:
+                    edited[index], edited[index + 1] = edited[index + 1], edited[index]
+                    counts["transposition"] += 1
+            verses.append((verse_id, edited, None))
+            position = end
+        return verses
+
+    def edit_verses(self, verses, rng, next_edit, counts):
+        # the verses after splits and merges, which only happen between verses of one chapter
+        output = []
+        index = 0
+        while index < len(verses):
+            verse_id, words, line = verses[index]
+            due = {}
+            for edit in VERSE_EDITS:
+                due[edit] = next_edit[edit] <= index
+                if due[edit]:
+                    next_edit[edit] = index + 1 + gap(rng, self.rates[edit])
+            has_next = index + 1 < len(verses) and verses[index + 1][0][:5] == verse_id[:5]
+            if due["merge"] and has_next:
+                output.append((verse_id, words + verses[index + 1][1], None))
+                counts["merge"] += 1
+                index += 2
+                continue
+            if due["split"] and has_next and len(words) > 1:
+                cut = rng.randint(1, len(words) - 1)
+                output.append((verse_id, words[:cut], None))
+                next_id, next_words, next_line = verses[index + 1]
+                verses[index + 1] = (next_id, words[cut:] + next_words, None)
+                counts["split"] += 1
+            else:
+                output.append((verse_id, words, line))
+            index += 1
+        return output
+
+    def generate(self, manuscript):
+        # ([(verse id, words, seed line or None)], {edit: count}) for one manuscript
+        rng = random.Random(f"{self.seed}:{manuscript}")
+        next_edit = {edit: gap(rng, self.rates[edit]) for edit in WORD_EDITS + VERSE_EDITS}
+        counts = dict.fromkeys(WORD_EDITS + VERSE_EDITS, 0)
+        verses = self.edit_words(rng, next_edit, counts)
+        return self.edit_verses(verses, rng, next_edit, counts), counts
+
+
+def write_edition(verses, path):
+    with open(path, 'w', encoding='utf-8', newline='\n') as outfile:
+        outfile.write("Verse\tWords\n")
+        outfile.write("".join([(line if line is not None else f"{verse_id}\t{' '.join(words)}") + "\n"
+                               for verse_id, words, line in verses]))
+
+
+def manuscript_edition(name, manuscript):
+    return f"{name}{manuscript:04d}"
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Write reproducible variant editions of a seed edition.")
+    parser.add_argument("--seed-edition", default="n1904", help="edition to vary (data/tsv/EDITION-verses.tsv)")
+    parser.add_argument("--manuscripts", type=int, default=10, help="number of variant editions to write")
+    parser.add_argument("--seed", type=int, default=1, help="random seed; the same seed writes the same files")
+    parser.add_argument("--name", default=DEFAULT_NAME,
+                        help="editions are named NAME0001, NAME0002, ...")
+    parser.add_argument("--output-dir", help="directory to write to (default: the data/tsv directory)")
+    for edit in WORD_EDITS + VERSE_EDITS:
+        parser.add_argument(f"--{edit}", type=float, default=DEFAULT_RATES[edit], metavar="RATE",
+                            help=f"chance of a {edit} per {'word' if edit in WORD_EDITS else 'verse'} "
+                                 f"(default {DEFAULT_RATES[edit]})")
+    args = parser.parse_args()
+    rates = {edit: getattr(args, edit) for edit in WORD_EDITS + VERSE_EDITS}
+    for edit, rate in rates.items():
+        if not 0 <= rate <= 1:
+            parser.error(f"--{edit} must be between 0 and 1")
+
+    start = time.perf_counter()
+    generator = ManuscriptGenerator(read_seed(f"{args.seed_edition}-verses.tsv"), rates, args.seed)
+    output_dir = args.output_dir or os.path.dirname(comparison_core.edition_path(""))
+    os.makedirs(output_dir, exist_ok=True)
+    totals = dict.fromkeys(rates, 0)
+    words = 0
+    for manuscript in range(1, args.manuscripts + 1):
+        verses, counts = generator.generate(manuscript)
+        write_edition(verses, os.path.join(output_dir, f"{manuscript_edition(args.name, manuscript)}-verses.tsv"))
+        for edit, count in counts.items():
+            totals[edit] += count
+        words += sum([len(verse_words) for verse_id, verse_words, line in verses])
+    print(f"Wrote {args.manuscripts} editions ({manuscript_edition(args.name, 1)} to "
+          f"{manuscript_edition(args.name, args.manuscripts)}, {words} words) to {output_dir} "
+          f"in {time.perf_counter() - start:.1f}s")
+    print(", ".join([f"{edit}: {count}" for edit, count in totals.items()]))
+
+
+if __name__ == "__main__":
+    main()
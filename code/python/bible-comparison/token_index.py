@@ -0,0 +1,203 @@
+"""Inverted index from normalized word to where it occurs in an edition.
+
+A TokenIndex maps each normalize_word() form to the sorted word ids it occurs
+at. A word id is the verse id * 1000 + the word's position, the integer form
+of Word.identifier. load_lines() can fill a TokenIndexBuilder while it
+parses an edition. open_index() keeps the built index in a file laid out like
+edition_cache's, rebuilt when the TSV or the normalization changes, so a
+lookup never has to read the TSV again.
+
+The set operations compare the verses a word occurs in between two editions.
+This answers questions like "where does this word appear in SBLGNT but not
+N1904?" in milliseconds, without rerunning the comparison:
+
+    python token_index.py WORD --in sblgnt --not-in n1904 [--index-dir DIR]
+"""
+
+import argparse
+import array
+import bisect
+import os
+import time
+
+import comparison_core
+import edition_cache
+
+
+INDEX_VERSION = 1
+# a word id is int(Word.identifier): verse id * WORD_POSITIONS + 1-based position of the word in the verse
+WORD_POSITIONS = 1000
+DEFAULT_INDEX_DIR = "indexes"
+
+
+class TokenIndexBuilder:
+    def __init__(self):
+        self.postings = {}
+        # normalize_word() of each raw word, so each distinct word is normalized once
+        self.normalized = {}
+
+    def add_verse(self, verse):
+        for word in verse.words.values():
+            token = self.normalized.get(word.text)
+            if token is None:
+                token = self.normalized[word.text] = comparison_core.normalize_word(word.text)
+            self.postings.setdefault(token, []).append(int(word.identifier))
+
+    def build(self, edition):
+        # verses are added in BCV order, so each posting list is already sorted
+        tokens = sorted(self.postings)
+        starts = array.array('I', [0])
+        postings = array.array('Q')
+        for token in tokens:
+            postings.extend(self.postings[token])
+            starts.append(len(postings))
+        return TokenIndex(edition, tokens, starts, postings)
+
+
+class TokenIndex:
+    def __init__(self, edition, tokens, starts, postings):
+        self.edition = edition
+        # sorted normalized words; the word ids of tokens[i] are postings[starts[i]:starts[i + 1]]
+        self.tokens = tokens
+        self.starts = starts
+        self.postings = postings
+        self.positions = {token: index for index, token in enumerate(tokens)}
+
+    def __len__(self):
+        return len(self.tokens)
+
+    def __contains__(self, word):
+        return comparison_core.normalize_word(word) in self.positions
+
+    def word_ids(self, word):
+        # sorted word ids of every occurrence of word (normalized first)
+        index = self.positions.get(comparison_core.normalize_word(word))
+        if index is None:
+            return []
+        return self.postings[self.starts[index]:self.starts[index + 1]]
+
+    def verse_ids(self, word):
+        # sorted ids of the verses word occurs in
+        verse_ids = []
+        for word_id in self.word_ids(word):
+            verse_id = word_id // WORD_POSITIONS
+            if not verse_ids or verse_ids[-1] != verse_id:
+                verse_ids.append(verse_id)
+        return verse_ids
+
+    def count(self, word):
+        return len(self.word_ids(word))
+
+    def prefix(self, prefix):
+        # the indexed words that start with prefix (normalized first)
+        prefix = comparison_core.normalize_word(prefix)
+        start = bisect.bisect_left(self.tokens, prefix)
+        end = start
+        while end < len(self.tokens) and self.tokens[end].startswith(prefix):
+            end += 1
+        return self.tokens[start:end]
+
+
+def verses_only_in(index1, index2, word):
+    # verse ids where word occurs in index1's edition but not in that verse of index2's
+    return sorted(set(index1.verse_ids(word)).difference(index2.verse_ids(word)))
+
+
+def verses_in_both(index1, index2, word):
+    return sorted(set(index1.verse_ids(word)).intersection(index2.verse_ids(word)))
+
+
+def verses_in_either(index1, index2, word):
+    return sorted(set(index1.verse_ids(word)).union(index2.verse_ids(word)))
+
+
+def tokens_only_in(index1, index2):
+    # words index1's edition has that index2's never uses
+    return [token for token in index1.tokens if token not in index2.positions]
+
+
+def build_index(edition, edition_file_name):
+    builder = TokenIndexBuilder()
+    for verse in comparison_core.iter_verses(edition, edition_file_name):
+        builder.add_verse(verse)
+    return builder.build(edition)
+
+
+def save_index(index, path, source_hash):
+    header = {"index_version": INDEX_VERSION, "edition": index.edition, "source_hash": source_hash,
+              "normalization": edition_cache.normalization_settings(), "token_count": len(index.tokens)}
+    edition_cache.write_sections(path, header, {
+        "tokens": edition_cache.pack_strings(index.tokens),
+        "starts": index.starts,
+        "postings": index.postings,
+    })
+
+
+def read_index(path, source_hash):
+    # returns None when there is no usable index for this source file and normalization, or the file is damaged
+    try:
+        with open(path, 'rb') as infile:
+            buffer = infile.read()
+    except FileNotFoundError:
+        return None
+    try:
+        return decode_index(buffer, source_hash)
+    except (ValueError, KeyError, TypeError):
+        # see edition_cache.read_edition()
+        return None
+
+
+def decode_index(buffer, source_hash):
+    header, data_start = edition_cache.read_header(buffer)
+    if (header is None or header.get("index_version") != INDEX_VERSION or header.get("source_hash") != source_hash
+            or header.get("normalization") != edition_cache.normalization_settings()):
+        return None
+
+    def section(name):
+        return edition_cache.read_section(buffer, header, data_start, name)
+
+    token_count = header["token_count"]
+    index = TokenIndex(header["edition"], edition_cache.unpack_strings(section("tokens"), token_count),
+                       section("starts"), section("postings"))
+    if (len(index.tokens) != token_count or len(index.starts) != token_count + 1
+            or index.starts[-1] != len(index.postings)):
+        raise ValueError("section lengths don't match the header")
+    return index
+
+
+def open_index(edition, edition_file_name, index_dir=DEFAULT_INDEX_DIR):
+    # load the index for an edition from index_dir, (re)building it first if it is missing or stale
+    start = time.perf_counter()
+    source_hash = edition_cache.file_hash(comparison_core.edition_path(edition_file_name))
+    path = os.path.join(index_dir, f"{edition}.index")
+    index = read_index(path, source_hash)
+    state = "warm"
+    if index is None:
+        state = "cold"
+        index = build_index(edition, edition_file_name)
+        save_index(index, path, source_hash)
+    print(f"Loaded {edition} index in {time.perf_counter() - start:.3f}s ({state})")
+    return index
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Find the verses a word occurs in in one edition but not another.")
+    parser.add_argument("word")
+    parser.add_argument("--in", dest="edition", default="sblgnt", help="edition the word occurs in")
+    parser.add_argument("--not-in", dest="other", default="n1904", help="edition it doesn't occur in")
+    parser.add_argument("--index-dir", default=DEFAULT_INDEX_DIR,
+                        help="directory the indexes are kept in, built on first use")
+    args = parser.parse_args()
+    index = open_index(args.edition, f"{args.edition}-verses.tsv", args.index_dir)
+    other = open_index(args.other, f"{args.other}-verses.tsv", args.index_dir)
+    start = time.perf_counter()
+    verse_ids = verses_only_in(index, other, args.word)
+    elapsed = time.perf_counter() - start
+    for verse_id in verse_ids:
+        print(f"{verse_id:08d}")
+    print(f"{len(verse_ids)} verses with {args.word} in {args.edition} but not {args.other} "
+          f"({index.count(args.word)} and {other.count(args.word)} occurrences; {elapsed * 1000:.2f} ms)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Find word-order differences (transpositions) in word-mode diffs.
+
+diff_main only states differences as deletions and insertions, so words that
+one edition has in a different order show up as a delete in one place and an
+insert of the same words in another. This post-pass indexes the deleted runs
+of a diff by their text, then looks each inserted run up in that index. A
+match is a run moved within the verse (or, with --span, within the verse or
+to a neighbouring verse). Each run is paired at most once, with the earliest
+unpaired run of the same text, so the whole pass is about one hash lookup per
+edit.
+"""
+
+import collections
+
+import diff_sequence
+
+
+DIFF_DELETE = diff_sequence.DIFF_DELETE
+DIFF_INSERT = diff_sequence.DIFF_INSERT
+
+
+def run_key(text):
+    # a run compares equal whether or not it ends the verse, where the last word has no trailing space
+    return " ".join(text.split())
+
+
+def find_transpositions(diffs, groups=None):
+    # (text, delete index, insert index) for each deleted run of diffs that is inserted elsewhere in diffs.
+    # groups, if given, numbers the verse each diff is in, in increasing order; runs are then only paired
+    # within a verse or between neighbouring verses.
+    deletes = {}
+    for index, (op, text) in enumerate(diffs):
+        if op == DIFF_DELETE:
+            key = run_key(text)
+            if key:
+                deletes.setdefault(key, collections.deque()).append(index)
+    transpositions = []
+    for index, (op, text) in enumerate(diffs):
+        if op == DIFF_INSERT:
+            key = run_key(text)
+            candidates = deletes.get(key)
+            if groups is not None:
+                # deletes too far back for this insert are too far back for every later one as well
+                while candidates and groups[candidates[0]] < groups[index] - 1:
+                    candidates.popleft()
+                if candidates and groups[candidates[0]] > groups[index] + 1:
+                    continue
+            if candidates:
+                transpositions.append((key, candidates.popleft(), index))
+    return transpositions
+
+
+def iter_transpositions(comparisons):
+    # fills in VerseComparison.transposed for each difference that doesn't have it yet
+    for comparison in comparisons:
+        if comparison.diff is not None and comparison.transposed is None:
+            comparison.transposed = find_transpositions(comparison.diff)
+        yield comparison